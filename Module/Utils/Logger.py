@@ -10,20 +10,36 @@
 
 import os
 import logging
+import functools
 from logging.handlers import TimedRotatingFileHandler
 from typing import Optional
 from dotenv import dotenv_values
 from pathlib import Path
 
+# 已经创建过的日志目录，避免重复调用 os.makedirs
+_CREATED_DIRS: set = set()
+
+
+@functools.lru_cache(maxsize=8)
+def _load_env(agent_home: str) -> dict:
+    """读取并缓存 ${AGENT_HOME}/Module/Utils/.env，同一进程内只解析一次"""
+    env_path = os.path.join(agent_home, 'Module', 'Utils', '.env')
+    return dotenv_values(env_path) if os.path.exists(env_path) else {}
+
 
 def setup_logger(name: str, log_path: str = "Log") -> logging.Logger:
     """
     配置并返回一个日志记录器
+
+    对同一个 name 重复调用时直接返回已配置的记录器，不会重复添加处理器
     """
+    logger = logging.getLogger(name)
+    if logger.handlers:
+        return logger
+
     # 优先读取 .env 中的 LOG_DIR，其次读取环境变量 LOG_DIR，最后回退到 ${AGENT_HOME}/Log
     agent_home = os.environ.get('AGENT_HOME', '.')
-    env_path = os.path.join(agent_home, 'Module', 'Utils', '.env')
-    env_vars = dotenv_values(env_path) if os.path.exists(env_path) else {}
+    env_vars = _load_env(agent_home)
     configured_log_dir = env_vars.get("LOG_DIR") or os.environ.get("LOG_DIR")
 
     if configured_log_dir:
@@ -37,7 +53,9 @@ def setup_logger(name: str, log_path: str = "Log") -> logging.Logger:
     else:
         _log_path = base_log_dir
 
-    os.makedirs(_log_path, exist_ok=True)
+    if _log_path not in _CREATED_DIRS:
+        os.makedirs(_log_path, exist_ok=True)
+        _CREATED_DIRS.add(_log_path)
     # 创建日志处理器
     file_handler = TimedRotatingFileHandler(f"{_log_path}/logger_{name}.log", when="midnight", interval=1, encoding="utf-8")
     file_handler.suffix = "%Y-%m-%d"
@@ -46,8 +64,7 @@ def setup_logger(name: str, log_path: str = "Log") -> logging.Logger:
     formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
     file_handler.setFormatter(formatter)
 
-    # 创建日志记录器
-    logger = logging.getLogger(name)
+    # 配置日志记录器
     logger.setLevel(logging.INFO)
     logger.addHandler(file_handler)
     logger.addHandler(logging.StreamHandler())  # 控制台输出
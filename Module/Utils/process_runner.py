@@ -5,18 +5,300 @@ Process runner: internal service process manager extracted from service_manager.
 提供最小化的进程启动/停止/状态接口：
 - ProcessRunner.init_services(state_dict)
 - ProcessRunner.stop_all_services()
+- ProcessRunner.stop_service(svc_name)
 - ProcessRunner.get_service_status()
+- load_service_config(path)：解析完整配置文件，与 ProcessRunner 共用解析缓存
 
 此模块用于将低层进程管理逻辑与外部管理器分离。
 """
 
 import os
+import sys
+import json
+import mmap
 import time
+import functools
+import shutil
 import subprocess
-import shlex
+import selectors
 import signal
+import threading
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait as wait_futures
 from pathlib import Path
-from typing import List, Tuple
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import yaml
+    # 优先使用 libyaml 的 C 实现，解析速度比纯 Python 版本快数倍
+    _Loader = yaml.CSafeLoader if hasattr(yaml, "CSafeLoader") else yaml.SafeLoader
+except ImportError:
+    yaml = None
+    _Loader = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# 已解析配置的缓存：绝对路径 -> (st_mtime_ns, st_size, 是否完整解析, 解析结果)。
+# 文件未变化时重复调用只需一次 stat，不再重复读取与解析；service_manager 读取配置也共用这份缓存。
+_PARSE_CACHE: Dict[str, Tuple[int, int, bool, object]] = {}
+_PARSE_LOCK = threading.Lock()
+
+# 超过该大小的配置文件只构造 `external_services` 子树，其余部分仅消费解析事件
+_STREAM_PARSE_THRESHOLD = 64 * 1024
+
+
+class _PartialParseError(Exception):
+    """事件流无法只抽取子树（例如引用了子树之外的锚点），需要回退到完整解析"""
+
+
+@functools.lru_cache(maxsize=None)
+def _resolve_cfg_path() -> Path:
+    """配置文件路径在进程生命周期内不变，只计算一次"""
+    # 直接使用根目录的 `service_config.yml`，不再依赖旧的 Init 目录
+    return Path(__file__).parents[2] / "service_config.yml"
+
+
+# 事件类型都是具体类，按 type() 查集合比逐个 isinstance 检查更快（跳过大段配置时每个事件都要判断）
+_OPEN_EVENTS = frozenset((yaml.SequenceStartEvent, yaml.MappingStartEvent)) if yaml else frozenset()
+_CLOSE_EVENTS = frozenset((yaml.SequenceEndEvent, yaml.MappingEndEvent)) if yaml else frozenset()
+
+
+def _skip_node(loader, event) -> None:
+    """消费以 event 开头的整个节点的事件，不创建任何 Python 对象"""
+    if type(event) not in _OPEN_EVENTS:
+        return
+    depth = 1
+    get_event = loader.get_event
+    while depth:
+        cls = type(get_event())
+        if cls in _OPEN_EVENTS:
+            depth += 1
+        elif cls in _CLOSE_EVENTS:
+            depth -= 1
+
+
+def _compose_node(loader, event, anchors: dict):
+    """按 PyYAML Composer 的规则由事件构造节点（只用于需要保留的子树）"""
+    if isinstance(event, yaml.AliasEvent):
+        if event.anchor not in anchors:
+            raise _PartialParseError(event.anchor)
+        return anchors[event.anchor]
+
+    tag = event.tag
+    if isinstance(event, yaml.ScalarEvent):
+        if tag is None or tag == '!':
+            tag = loader.resolve(yaml.ScalarNode, event.value, event.implicit)
+        node = yaml.ScalarNode(tag, event.value, event.start_mark, event.end_mark, style=event.style)
+        if event.anchor is not None:
+            anchors[event.anchor] = node
+        return node
+
+    if isinstance(event, yaml.SequenceStartEvent):
+        if tag is None or tag == '!':
+            tag = loader.resolve(yaml.SequenceNode, None, event.implicit)
+        node = yaml.SequenceNode(tag, [], event.start_mark, None, flow_style=event.flow_style)
+        if event.anchor is not None:
+            anchors[event.anchor] = node
+        while not loader.check_event(yaml.SequenceEndEvent):
+            node.value.append(_compose_node(loader, loader.get_event(), anchors))
+    else:
+        if tag is None or tag == '!':
+            tag = loader.resolve(yaml.MappingNode, None, event.implicit)
+        node = yaml.MappingNode(tag, [], event.start_mark, None, flow_style=event.flow_style)
+        if event.anchor is not None:
+            anchors[event.anchor] = node
+        while not loader.check_event(yaml.MappingEndEvent):
+            key = _compose_node(loader, loader.get_event(), anchors)
+            value = _compose_node(loader, loader.get_event(), anchors)
+            node.value.append((key, value))
+    node.end_mark = loader.get_event().end_mark
+    return node
+
+
+def _load_external_services(stream) -> dict:
+    """
+    只解析顶层 `external_services` 子树，返回 {'external_services': ...}
+
+    与完整解析保持一致：重复的键以最后一次出现为准；没有该键时抛出 _PartialParseError，
+    由调用方回退到完整解析（_load_config 会把整个顶层映射当作服务配置）
+    """
+    loader = _Loader(stream)
+    try:
+        loader.get_event()  # StreamStartEvent
+        if not loader.check_event(yaml.DocumentStartEvent):
+            return {}
+        loader.get_event()
+        if not loader.check_event(yaml.MappingStartEvent):
+            raise _PartialParseError("top-level node is not a mapping")
+        loader.get_event()
+
+        anchors: dict = {}
+        node = None
+        while not loader.check_event(yaml.MappingEndEvent):
+            key = loader.get_event()
+            if isinstance(key, yaml.ScalarEvent) and key.value == 'external_services':
+                # 继续扫描剩余的键，重复出现时保留最后一个
+                node = _compose_node(loader, loader.get_event(), anchors)
+                continue
+            if key.anchor is not None:
+                # 锚点可能被目标子树引用，无法安全跳过
+                raise _PartialParseError(key.anchor)
+            _skip_node(loader, key)
+            value = loader.get_event()
+            if getattr(value, 'anchor', None) is not None:
+                raise _PartialParseError(value.anchor)
+            _skip_node(loader, value)
+        if node is None:
+            raise _PartialParseError("external_services not found")
+        return {'external_services': loader.construct_document(node)}
+    finally:
+        loader.dispose()
+
+
+def _load_yaml_stream(stream, size: int) -> dict:
+    """解析配置流；大文件优先只抽取 external_services 子树"""
+    if size > _STREAM_PARSE_THRESHOLD:
+        try:
+            return _load_external_services(stream)
+        except _PartialParseError:
+            stream.seek(0)
+    return yaml.load(stream, Loader=_Loader) or {}
+
+
+def _parse_config_file(cfg_path, full: bool = False):
+    """
+    解析 YAML 配置文件，文件未修改时复用缓存结果（调用方不应修改返回值）
+
+    full=False 时大文件只抽取 external_services 子树，已缓存的完整解析结果同样满足这种调用；
+    full=True 返回完整文档（空文件为 None）
+    """
+    path = os.path.abspath(cfg_path)
+    st = os.stat(path)
+    cached = _PARSE_CACHE.get(path)
+    if (cached is not None and cached[0] == st.st_mtime_ns and cached[1] == st.st_size
+            and (cached[2] or not full)):
+        return cached[3]
+
+    with open(path, 'rb') as f:
+        try:
+            # 直接把原始 UTF-8 字节交给 libyaml，省去文本层的解码与拷贝
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                config = yaml.load(mm, Loader=_Loader) if full else _load_yaml_stream(mm, st.st_size)
+        except (ValueError, OSError):
+            # 空文件或不支持 mmap 的平台
+            f.seek(0)
+            config = yaml.load(f.read(), Loader=_Loader)
+    if not full:
+        config = config or {}
+
+    with _PARSE_LOCK:
+        # 同一路径只保留最新版本的解析结果
+        _PARSE_CACHE[path] = (st.st_mtime_ns, st.st_size, full, config)
+    return config
+
+
+def load_service_config(path):
+    """
+    解析完整的服务配置文件（空文件返回 None），与 ProcessRunner 共用同一份按 mtime/size 失效的解析缓存
+
+    返回值会被缓存共享，调用方不要修改；文件不存在时抛出 FileNotFoundError
+    """
+    return _parse_config_file(path, full=True)
+
+
+# 命令行中表示端口的参数，以及未显式指定端口时的兜底端口
+_PORT_FLAGS = frozenset(('-p', '--port'))
+_PORT_DEFAULTS = {'ollama_server': 11434, 'Consul': 8500}
+
+
+def _extract_port(args) -> Optional[int]:
+    """单次扫描 args，返回最后一个 `-p/--port <数字>` 指定的端口"""
+    port = None
+    for flag, value in zip(args, args[1:]):
+        if flag in _PORT_FLAGS and isinstance(value, str) and value.isdigit():
+            port = int(value)
+    return port
+
+
+# 启动服务所需的字段，在加载配置时一次性从 dict 中取出
+ServiceConf = namedtuple('ServiceConf', 'script args use_python conda_env run_bg dependencies',
+                         defaults=(None, (), False, '', True, ()))
+
+
+def _make_service_conf(svc_conf) -> Optional[ServiceConf]:
+    """将单个服务的配置 dict 转换为 ServiceConf，配置不合法时返回 None"""
+    # 配置来自 yaml/json 解析，只会是内置类型，直接比较 type 即可
+    if type(svc_conf) is not dict:
+        return None
+    args = svc_conf.get('args', []) or []
+    if type(args) is not list and type(args) is not tuple:
+        return None
+    deps = svc_conf.get('dependencies', []) or []
+    if isinstance(deps, str):
+        deps = [deps]
+    return ServiceConf(
+        script=svc_conf.get('script'),
+        args=tuple(args),
+        use_python=svc_conf.get('use_python', False),
+        conda_env=svc_conf.get('conda_env', ''),
+        run_bg=svc_conf.get('run_in_background', True),
+        dependencies=tuple(deps) if isinstance(deps, (list, tuple)) else (),
+    )
+
+
+def _normalize_services(items, seen: set, duplicates: list) -> List[Tuple[str, Optional[ServiceConf]]]:
+    """
+    将配置中的服务条目统一展开为 (服务名, ServiceConf) 列表；无法识别的条目配置为 None
+
+    与 seen 中已有服务同名的有效条目会被丢弃（保留先出现的），其名称追加到 duplicates
+    """
+    normalized = []
+    for svc_item in items or []:
+        # svc_item 通常是 {name: config}
+        if isinstance(svc_item, dict) and len(svc_item) == 1:
+            svc_name, svc_conf = next(iter(svc_item.items()))
+        elif isinstance(svc_item, dict) and 'service_name' in svc_item:
+            svc_name, svc_conf = svc_item.get('service_name'), svc_item
+        else:
+            svc_name, svc_conf = 'unknown', None
+        # 服务名会作为多个字典（进程表、状态缓存、state_dict）的键反复查找，驻留后比较只需比对指针
+        if type(svc_name) is str:
+            svc_name = sys.intern(svc_name)
+        conf = _make_service_conf(svc_conf)
+        if conf is not None:
+            # 进程表按服务名索引，同名服务会互相覆盖，在加载时就剔除
+            n_seen = len(seen)
+            seen.add(svc_name)
+            if len(seen) == n_seen:
+                duplicates.append(svc_name)
+                continue
+        normalized.append((svc_name, conf))
+    return normalized
+
+
+def _start_prerequisites(names: List[str], confs: List[Optional[ServiceConf]]) -> List[set]:
+    """
+    返回每个服务启动前必须先完成启动的服务下标集合
+
+    包括 dependencies 中列出的服务；前台服务（run_in_background: false）按配置顺序充当屏障：
+    它前面的服务都启动完成后才运行，它后面的服务要等它运行结束后才启动。依赖不存在的服务视为已满足
+    """
+    index = {name: i for i, name in enumerate(names)}
+    prereqs = []
+    barrier = None
+    for i, conf in enumerate(confs):
+        deps = conf.dependencies if conf is not None else ()
+        req = {index[d] for d in deps if d in index and index[d] != i}
+        if barrier is not None:
+            req.add(barrier)
+        if conf is not None and not conf.run_bg:
+            req.update(range(i))
+            barrier = i
+        prereqs.append(req)
+    return prereqs
 
 
 class ProcessRunner:
@@ -25,54 +307,76 @@ class ProcessRunner:
     提供启动 / 停止 / 状态查询的基础能力，设计为被高层管理器调用。
     """
 
-    def __init__(self):
-        self.base_processes = []  # List[Tuple[name, Popen]]
-        self.optional_processes = []
+    def __init__(self, logger=None):
+        self.logger = logger
+        # 服务名 -> (Popen, pgid)，按服务名 O(1) 查找/移除
+        self.base_processes: Dict[str, Tuple[subprocess.Popen, int]] = {}
+        self.optional_processes: Dict[str, Tuple[subprocess.Popen, int]] = {}
+        # 与进程字典一一对应的状态字典，get_service_status 原地更新 status 字段
+        self._status_cache_base: Dict[str, dict] = {}
+        self._status_cache_optional: Dict[str, dict] = {}
         self.config = {}
+        # 在 _load_config 中预先展开的 (服务名, 服务配置) 列表
+        self._base_items: List[Tuple[str, Optional[ServiceConf]]] = []
+        self._optional_items: List[Tuple[str, Optional[ServiceConf]]] = []
+        self._script_cache: Dict[str, str] = {}  # script -> shutil.which 解析结果
+        self._python_cache: Dict[str, str] = {}  # conda_env -> 解释器路径，共用同一环境的服务只拼接一次
+        # 服务并行启动时保护进程列表与 state_dict 的写入
+        self._lock = threading.Lock()
+        # 启动服务用的线程池，首次使用时创建，之后重复使用
+        self._start_pool: Optional[ThreadPoolExecutor] = None
 
     def _load_config(self):
-        project_root = Path(__file__).parents[2]
-        # 直接使用根目录的 `service_config.yml`，不再依赖旧的 Init 目录
-        cfg_path = project_root / "service_config.yml"
+        cfg_path = _resolve_cfg_path()
 
-        if not cfg_path.exists():
+        if not cfg_path.exists() or yaml is None:
             self.config = {'external_services': {'base_services': [], 'optional_services': []}}
+            self._base_items, self._optional_items = [], []
             return
 
-        import yaml
         try:
-            with open(cfg_path, 'r', encoding='utf-8') as f:
-                full = yaml.safe_load(f) or {}
-                self.config = full.get('external_services', full)
+            full = _parse_config_file(cfg_path)
+            self.config = full.get('external_services', full)
         except Exception:
             self.config = {'external_services': {'base_services': [], 'optional_services': []}}
 
-    def _start_service_from_config(self, svc_item, is_base: bool, state_dict=None):
-        # svc_item 通常是 {name: config}
+        seen, duplicates = set(), []
+        self._base_items = _normalize_services(self.config.get('base_services'), seen, duplicates)
+        self._optional_items = _normalize_services(self.config.get('optional_services'), seen, duplicates)
+        if duplicates and self.logger is not None:
+            self.logger.warning(f"配置中存在重复的服务名，仅启动第一个: {', '.join(map(str, duplicates))}")
+
+    def _resolve_script(self, script: str) -> str:
+        """在 PATH 中解析可执行文件，结果按 script 缓存"""
+        resolved = self._script_cache.get(script)
+        if resolved is None:
+            resolved = shutil.which(script) or script
+            self._script_cache[script] = resolved
+        return resolved
+
+    def _python_bin(self, conda_env: str) -> str:
+        """返回 conda 环境中的 python 解释器路径，结果按 conda_env 缓存"""
+        python_bin = self._python_cache.get(conda_env)
+        if python_bin is None:
+            python_bin = os.path.join(conda_env, 'bin', 'python')
+            self._python_cache[conda_env] = python_bin
+        return python_bin
+
+    def _start_service_from_config(self, svc_name: str, svc_conf: Optional[ServiceConf], is_base: bool,
+                                   state_dict=None):
+        if svc_conf is None:
+            return (svc_name, -1)
+
         try:
-            if isinstance(svc_item, dict) and len(svc_item) == 1:
-                svc_name = list(svc_item.keys())[0]
-                svc_conf = svc_item[svc_name]
-            elif isinstance(svc_item, dict) and 'service_name' in svc_item:
-                svc_name = svc_item.get('service_name')
-                svc_conf = svc_item
-            else:
-                return ("unknown", -1)
-
-            script = svc_conf.get('script')
-            args = svc_conf.get('args', []) or []
-            use_python = svc_conf.get('use_python', False)
-            conda_env = svc_conf.get('conda_env', '')
-            run_bg = svc_conf.get('run_in_background', True)
-
-            if use_python and conda_env and script:
-                python_bin = os.path.join(conda_env, 'bin', 'python')
-                cmd = [python_bin, script] + args
-                shell = False
+            script = svc_conf.script
+            args = svc_conf.args
+
+            if svc_conf.use_python and svc_conf.conda_env and script:
+                cmd = [self._python_bin(svc_conf.conda_env), script, *args]
             else:
                 if isinstance(script, str):
-                    cmd = [script] + args
-                    shell = True
+                    # 直接 exec 可执行文件，不经由 /bin/sh 多 fork 一次
+                    cmd = [self._resolve_script(script), *args]
                 else:
                     return (svc_name, -1)
 
@@ -80,115 +384,258 @@ class ProcessRunner:
             if isinstance(script, str) and os.path.isabs(script):
                 cwd = os.path.dirname(script) or None
 
-            # 自动从 args 里提取端口号
-            def extract_port(args_list):
-                port = None
-                for i, a in enumerate(args_list):
-                    if a in ('-p', '--port') and i + 1 < len(args_list):
-                        try:
-                            port_candidate = args_list[i + 1]
-                            if isinstance(port_candidate, str) and port_candidate.isdigit():
-                                port = int(port_candidate)
-                        except Exception:
-                            continue
-                return port
-
-            port = extract_port(args)
-            # 兜底：部分服务端口写死
-            if not port and svc_name == 'ollama_server':
-                port = 11434
-            if not port and svc_name == 'Consul':
-                port = 8500
-
-            if run_bg:
-                if shell:
-                    proc = subprocess.Popen(' '.join(shlex.quote(a) for a in cmd), shell=True,
-                                             stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
-                                             preexec_fn=os.setsid, cwd=cwd)
-                else:
-                    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
-                                             preexec_fn=os.setsid, cwd=cwd)
+            # 自动从 args 里提取端口号，兜底使用写死的默认端口
+            port = _extract_port(args) or _PORT_DEFAULTS.get(svc_name)
+
+            if svc_conf.run_bg:
+                # 同名服务仍在运行时不重复启动，避免覆盖进程表后旧进程无人管理；已退出的旧条目直接替换
+                with self._lock:
+                    existing = self.base_processes.get(svc_name) or self.optional_processes.get(svc_name)
+                    if existing is not None and not self._is_running(existing[0]):
+                        self.base_processes.pop(svc_name, None)
+                        self.optional_processes.pop(svc_name, None)
+                        self._status_cache_base.pop(svc_name, None)
+                        self._status_cache_optional.pop(svc_name, None)
+                        existing = None
+                if existing is not None:
+                    if self.logger is not None:
+                        self.logger.warning(f"服务 {svc_name} 已在运行 (pid={existing[0].pid})，跳过重复启动")
+                    return (svc_name, existing[0].pid)
+
+                proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                        start_new_session=True, cwd=cwd)
 
                 pid = proc.pid
-                if is_base:
-                    self.base_processes.append((svc_name, proc))
-                else:
-                    self.optional_processes.append((svc_name, proc))
-
-                # 记录 pid 和端口到 state_dict
-                if state_dict is not None:
-                    state_dict[svc_name] = {
-                        'pid': pid,
-                        'start_time': time.time(),
-                        'script': script,
-                        'args': args,
-                        'cwd': cwd,
-                        'port': port
-                    }
+                # 只保存基础类型，便于直接序列化为 JSON；args 以新 list 保存，不与缓存的配置共享
+                entry = {
+                    'pid': pid,
+                    'start_time': int(time.time()),
+                    'script': script,
+                    'args': list(args),
+                    'cwd': str(cwd) if cwd else None,
+                    'port': port
+                }
+                status = {'name': svc_name, 'pid': pid, 'status': 'running'}
+                with self._lock:
+                    # 子进程以 start_new_session 启动，成为新进程组的组长，pgid 即为 pid
+                    if is_base:
+                        self.base_processes[svc_name] = (proc, pid)
+                        self._status_cache_base[svc_name] = status
+                    else:
+                        self.optional_processes[svc_name] = (proc, pid)
+                        self._status_cache_optional[svc_name] = status
+
+                    # 记录 pid 和端口到 state_dict
+                    if state_dict is not None:
+                        state_dict[svc_name] = entry
 
                 return (svc_name, pid)
             else:
                 # 前台运行：同步执行
-                if shell:
-                    subprocess.run(' '.join(shlex.quote(a) for a in cmd), shell=True, check=True, cwd=cwd)
-                else:
-                    subprocess.run(cmd, check=True, cwd=cwd)
+                subprocess.run(cmd, check=True, cwd=cwd)
                 return (svc_name, -1)
 
         except Exception:
-            return (svc_name if 'svc_name' in locals() else 'unknown', -1)
+            return (svc_name, -1)
 
     def init_services(self, state_dict=None):
         self._load_config()
-        base_cfg = self.config.get('base_services', [])
-        optional_cfg = self.config.get('optional_services') or []
-
-        base_results = []
-        optional_results = []
-
-        for item in base_cfg:
-            base_results.append(self._start_service_from_config(item, True, state_dict=state_dict))
-
-        for item in optional_cfg:
-            optional_results.append(self._start_service_from_config(item, False, state_dict=state_dict))
-
-        return base_results, optional_results
-
-    def stop_all_services(self):
-        # 停止可选服务
-        for name, proc in self.optional_processes.copy():
+        base_cfg = self._base_items
+        optional_cfg = self._optional_items
+
+        total = len(base_cfg) + len(optional_cfg)
+        if total == 0:
+            return [], []
+
+        names = [name for name, _ in base_cfg] + [name for name, _ in optional_cfg]
+        confs = [conf for _, conf in base_cfg] + [conf for _, conf in optional_cfg]
+        n_base = len(base_cfg)
+
+        # Popen 在 fork/exec 期间释放 GIL，并行启动使总耗时接近最慢的一个服务而非所有服务之和；
+        # 每个服务在其前置服务（见 _start_prerequisites）全部启动完成后立即提交，不等待无关的服务
+        if self._start_pool is None:
+            self._start_pool = ThreadPoolExecutor(max_workers=8)
+        prereqs = _start_prerequisites(names, confs)
+        dependents = [[] for _ in range(total)]
+        for i, req in enumerate(prereqs):
+            for j in req:
+                dependents[j].append(i)
+        remaining = [len(req) for req in prereqs]
+        pending = set(range(total))
+        ready = [i for i in range(total) if not remaining[i]]
+        running = {}
+        results = [None] * total
+        while pending or running:
+            if not ready and not running:
+                # 循环依赖（包括跨越前台屏障的依赖）：按配置顺序逐个放行
+                ready = [min(pending)]
+            for i in ready:
+                pending.discard(i)
+                future = self._start_pool.submit(self._start_service_from_config,
+                                                 names[i], confs[i], i < n_base, state_dict)
+                running[future] = i
+            ready = []
+            done, _ = wait_futures(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                i = running.pop(future)
+                results[i] = future.result()
+                for j in dependents[i]:
+                    remaining[j] -= 1
+                    if not remaining[j] and j in pending:
+                        ready.append(j)
+
+        return results[:n_base], results[n_base:]
+
+    def stop_all_services(self, grace: float = 5.0):
+        """
+        停止所有服务：先向所有进程组发送 SIGTERM，再在同一个 grace 秒的截止时间内等待全部退出，
+        超时仍未退出的进程组发送 SIGKILL
+        """
+        # 在锁内取出并清空进程表，发信号和回收在锁外进行
+        with self._lock:
+            # 先停止可选服务，再停止基础服务；pgid 在启动时已记录，无需再调用 getpgid
+            victims = list(self.optional_processes.values()) + list(self.base_processes.values())
+            self.base_processes.clear()
+            self.optional_processes.clear()
+            self._status_cache_base.clear()
+            self._status_cache_optional.clear()
+
+        signaled = []
+        for proc, pgid in victims:
             try:
-                if proc.poll() is None:
-                    os.killpg(os.getpgid(proc.pid), signal.SIGTERM)
+                if self._is_running(proc):
+                    os.killpg(pgid, signal.SIGTERM)
+                    signaled.append((proc, pgid))
             except Exception:
                 pass
 
-        # 停止基础服务
-        for name, proc in self.base_processes.copy():
+        # 所有进程共享一个截止时间，总等待时间不超过 grace 而不是 N * grace；
+        # 超时的进程组先全部发送 SIGKILL，再统一回收
+        survivors = self._wait_exited(signaled, time.monotonic() + grace)
+        for proc, pgid in survivors:
+            try:
+                os.killpg(pgid, signal.SIGKILL)
+            except Exception:
+                pass
+        for proc, pgid in survivors:
             try:
-                if proc.poll() is None:
-                    os.killpg(os.getpgid(proc.pid), signal.SIGTERM)
+                proc.wait(timeout=1)
             except Exception:
                 pass
 
-        self.base_processes.clear()
-        self.optional_processes.clear()
+    @staticmethod
+    def _wait_exited(procs, deadline: float) -> List[Tuple[subprocess.Popen, int]]:
+        """等待一批进程在 deadline 前退出，返回仍在运行的 (proc, pgid) 列表
+
+        支持 pidfd 的系统上所有进程注册到同一个 selector，进程退出时由内核唤醒，
+        不需要像 Popen.wait(timeout) 那样逐个睡眠轮询
+        """
+        selector = selectors.DefaultSelector()
+        fds = []
+        try:
+            for proc, pgid in procs:
+                try:
+                    fd = os.pidfd_open(proc.pid)
+                except ProcessLookupError:
+                    continue  # 已经被回收
+                fds.append(fd)
+                selector.register(fd, selectors.EVENT_READ, (proc, pgid))
+        except (AttributeError, OSError):
+            # 不支持 pidfd：退回逐个 wait，仍共享同一个截止时间
+            for fd in fds:
+                os.close(fd)
+            selector.close()
+            survivors = []
+            for proc, pgid in procs:
+                try:
+                    proc.wait(timeout=max(0.0, deadline - time.monotonic()))
+                except subprocess.TimeoutExpired:
+                    survivors.append((proc, pgid))
+                except Exception:
+                    pass
+            return survivors
+
+        try:
+            while selector.get_map():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                for key, _ in selector.select(remaining):
+                    selector.unregister(key.fileobj)
+                    key.data[0].poll()
+            return [key.data for key in selector.get_map().values()]
+        finally:
+            selector.close()
+            for fd in fds:
+                os.close(fd)
+
+    def stop_service(self, svc_name: str) -> bool:
+        """停止单个服务，返回是否找到该服务"""
+        with self._lock:
+            item = self.optional_processes.pop(svc_name, None)
+            if item is not None:
+                self._status_cache_optional.pop(svc_name, None)
+            else:
+                item = self.base_processes.pop(svc_name, None)
+                self._status_cache_base.pop(svc_name, None)
+
+        if item is None:
+            return False
+
+        proc, pgid = item
+        try:
+            if self._is_running(proc):
+                os.killpg(pgid, signal.SIGTERM)
+        except Exception:
+            pass
+        return True
+
+    @staticmethod
+    def _no_exited_children() -> bool:
+        """本进程没有已退出但未被回收的子进程时返回 True；无法判断（如平台不支持 waitid）时返回 False"""
+        try:
+            return os.waitid(os.P_ALL, 0, os.WEXITED | os.WNOHANG | os.WNOWAIT) is None
+        except ChildProcessError:
+            return True
+        except (AttributeError, OSError):
+            return False
+
+    @staticmethod
+    def _is_running(proc) -> bool:
+        # 只回收自己启动的子进程，不能用 waitpid(-1) 抢走其他代码（如 subprocess.run）的子进程
+        return proc.poll() is None
+
+    def dump_state(self, path, state_dict) -> None:
+        """将 state_dict 写入 path；安装了 orjson 时直接生成 bytes 写入文件描述符"""
+        if orjson is not None:
+            data = orjson.dumps(state_dict, option=orjson.OPT_APPEND_NEWLINE)
+        else:
+            data = (json.dumps(state_dict, ensure_ascii=False) + "\n").encode('utf-8')
+
+        fd = os.open(str(path), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            view = memoryview(data)
+            while view:
+                written = os.write(fd, view)
+                view = view[written:]
+        finally:
+            os.close(fd)
 
     def get_service_status(self):
-        base_status = []
-        for name, proc in self.base_processes:
-            base_status.append({
-                'name': name,
-                'pid': proc.pid,
-                'status': 'running' if proc.poll() is None else 'stopped'
-            })
-
-        optional_status = []
-        for name, proc in self.optional_processes:
-            optional_status.append({
-                'name': name,
-                'pid': proc.pid,
-                'status': 'running' if proc.poll() is None else 'stopped'
-            })
-
-        return {'base_services': base_status, 'optional_services': optional_status}
+        # 锁内只做快照，状态判断在锁外进行
+        with self._lock:
+            base = [(proc, self._status_cache_base[name]) for name, (proc, pgid) in self.base_processes.items()]
+            optional = [(proc, self._status_cache_optional[name])
+                        for name, (proc, pgid) in self.optional_processes.items()]
+
+        # 先用一次 waitid(P_ALL, WNOWAIT) 查看是否有任何已退出、尚未回收的子进程：WNOWAIT 只查看不回收，
+        # 不会抢走其他代码的子进程退出状态。没有时所有未回收的服务都仍在运行，无需逐个 poll()
+        if self._no_exited_children():
+            for proc, status in base + optional:
+                status['status'] = 'running' if proc.returncode is None else 'stopped'
+        else:
+            for proc, status in base + optional:
+                status['status'] = 'running' if self._is_running(proc) else 'stopped'
+
+        return {'base_services': [status for _, status in base],
+                'optional_services': [status for _, status in optional]}
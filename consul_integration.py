@@ -13,8 +13,15 @@ import time
 import logging
 import subprocess
 import os
+import errno
+import random
 import signal
 import socket
+import selectors
+import threading
+import functools
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor, wait as wait_futures
 from typing import Dict, List, Optional, Tuple, Any
 from dataclasses import dataclass
 
@@ -24,6 +31,49 @@ try:
 except ImportError:
     HAS_CONSUL = False
 
+try:
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+    HAS_REQUESTS = True
+except ImportError:
+    HAS_REQUESTS = False
+
+
+# 各服务默认的健康检查URL模板，使用时按端口格式化
+_HC_TEMPLATES: Dict[str, str] = {
+    "Consul": "http://127.0.0.1:{port}/v1/status/leader",
+    "ollama_server": "http://127.0.0.1:{port}/api/tags",
+    "GPTSoVits_server": "http://127.0.0.1:{port}/health",
+    "SenseVoice_server": "http://127.0.0.1:{port}/health",
+    "MicroServiceGateway": "http://127.0.0.1:{port}/health",
+    "APIGateway": "http://127.0.0.1:{port}/health",
+    "MySQLAgent": "http://127.0.0.1:{port}/health",
+    "MySQLService": "http://127.0.0.1:{port}/health",
+    "UserService": "http://127.0.0.1:{port}/health"
+}
+
+
+def _valid_port(port) -> Optional[int]:
+    """将配置中的端口转换为 int，不是 1-65535 之间的整数时返回 None"""
+    if (isinstance(port, int) and not isinstance(port, bool)) or (isinstance(port, str) and port.isdigit()):
+        port = int(port)
+        if 0 < port < 65536:
+            return port
+    return None
+
+
+@functools.lru_cache(maxsize=256)
+def _make_check(kind: str, target: str, port: int) -> Dict[str, Any]:
+    """
+    构造并缓存健康检查定义（间隔、超时等参数都是固定值）
+    
+    kind 为 "tcp" 时 target 是主机地址，为 "http" 时 target 是检查URL、port 忽略。
+    返回的字典被多次注册共享，调用方不要修改
+    """
+    if kind == "tcp":
+        return consul.Check.tcp(host=target, port=port, interval="10s", timeout="5s", deregister="30s")
+    return consul.Check.http(url=target, interval="10s", timeout="5s", deregister="30s")
+
 
 @dataclass
 class ServiceInfo:
@@ -48,18 +98,41 @@ class ConsulManager:
         self.logger = logger or logging.getLogger(__name__)
         self.consul_process = None
         self.consul_pid = None
+        
+        # 探测用的客户端按地址复用，启动等待期间不必每次都重新构造
+        self._probe_client = None
+        self._probe_addr: Optional[Tuple[str, int]] = None
     
-    def is_consul_running(self, host: str = "127.0.0.1", port: int = 8500) -> bool:
-        """检查 Consul 是否正在运行"""
+    def probe_client(self, host: str = "127.0.0.1", port: int = 8500):
+        """
+        探测 Consul 是否正在运行
+        
+        Returns:
+            探测成功时返回已验证可用的 consul.Consul 客户端，调用方可以直接复用；否则返回 None
+        """
+        # 端口都连不上就没必要再构造 HTTP 客户端了
+        if not self._port_open(host, port):
+            return None
+        
         try:
-            import consul
-            c = consul.Consul(host=host, port=port)
+            if self._probe_client is None or self._probe_addr != (host, port):
+                import consul
+                self._probe_client = consul.Consul(host=host, port=port)
+                self._probe_addr = (host, port)
             # 尝试访问 Consul API
-            c.status.leader()
-            return True
+            self._probe_client.status.leader()
+            return self._probe_client
         except Exception as e:
-            self.logger.debug(f"Consul 连接检查失败: {e}")
-            return False
+            self.logger.debug("Consul 连接检查失败: %s", e)
+            return None
+    
+    def is_consul_running(self, host: str = "127.0.0.1", port: int = 8500) -> bool:
+        """检查 Consul 是否正在运行（只检查 HTTP 端口能否建立 TCP 连接）"""
+        return self._port_open(host, port)
+    
+    def _api_leader_reachable(self, host: str = "127.0.0.1", port: int = 8500) -> bool:
+        """检查 Consul HTTP API 是否可以正常应答（status/leader）"""
+        return self.probe_client(host, port) is not None
     
     def start_consul(self, dev_mode: bool = True, client_addr: str = "0.0.0.0") -> bool:
         """
@@ -91,25 +164,21 @@ class ConsulManager:
             self.logger.info(f"启动 Consul: {' '.join(cmd)}")
             
             # 启动 Consul 进程
+            # 输出没有人读取，使用管道会在缓冲区写满后阻塞 Consul，直接丢弃
             self.consul_process = subprocess.Popen(
                 cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                preexec_fn=os.setsid  # 创建新的进程组
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                start_new_session=True  # 创建新的进程组
             )
             
             self.consul_pid = self.consul_process.pid
             self.logger.info(f"Consul 进程已启动，PID: {self.consul_pid}")
             
             # 等待 Consul 启动完成
-            max_wait = 30  # 最多等待30秒
-            for i in range(max_wait):
-                if self.is_consul_running():
-                    self.logger.info(f"Consul 启动成功，耗时 {i+1} 秒")
-                    return True
-                time.sleep(1)
+            if self._wait_until_ready(max_wait=30.0):
+                return True
             
-            self.logger.error("Consul 启动超时")
             self.stop_consul()
             return False
             
@@ -120,6 +189,64 @@ class ConsulManager:
             self.logger.error(f"启动 Consul 失败: {e}")
             return False
     
+    def _wait_until_ready(self, max_wait: float, host: str = "127.0.0.1", port: int = 8500) -> bool:
+        """
+        等待新启动的 Consul 就绪
+        
+        先用廉价的 TCP 连接探测端口，端口打开后才发起一次 HTTP 确认（见 probe_client）；
+        探测间隔从 50ms 指数增长到 250ms。支持 pidfd 的系统上进程提前退出会立即唤醒等待
+        """
+        start = time.monotonic()
+        deadline = start + max_wait
+        interval = 0.05
+        
+        selector = None
+        pidfd = None
+        try:
+            pidfd = os.pidfd_open(self.consul_process.pid)
+            selector = selectors.DefaultSelector()
+            selector.register(pidfd, selectors.EVENT_READ)
+        except (AttributeError, OSError):
+            pass
+        
+        try:
+            while True:
+                if self._api_leader_reachable(host, port):
+                    self.logger.info(f"Consul 启动成功，耗时 {time.monotonic() - start:.2f} 秒")
+                    return True
+                
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.logger.error("Consul 启动超时")
+                    return False
+                
+                timeout = min(interval, remaining)
+                if selector is not None:
+                    exited = bool(selector.select(timeout))
+                else:
+                    time.sleep(timeout)
+                    exited = False
+                
+                if exited or self.consul_process.poll() is not None:
+                    self.logger.error(f"Consul 进程启动后立即退出，返回码: {self.consul_process.wait()}")
+                    return False
+                
+                interval = min(interval * 2, 0.25)
+        finally:
+            if selector is not None:
+                selector.close()
+            if pidfd is not None:
+                os.close(pidfd)
+    
+    @staticmethod
+    def _port_open(host: str, port: int) -> bool:
+        """检查端口是否已经可以建立 TCP 连接"""
+        try:
+            with socket.create_connection((host, port), timeout=0.2):
+                return True
+        except OSError:
+            return False
+    
     def stop_consul(self):
         """停止 Consul 进程"""
         if self.consul_process:
@@ -176,9 +303,34 @@ class ConsulServiceRegistry:
         """
         self.consul_url = consul_url
         self.service_prefix = service_prefix
+        # 本实例管理的服务名/服务ID都以 "前缀-" 开头，过滤时直接使用
+        self._prefix_dash = f"{service_prefix}-" if service_prefix else ""
         self.auto_start_consul = auto_start_consul
         self.logger = logger or logging.getLogger(__name__)
         
+        # 服务名 -> 带前缀的 Consul 服务名，同一个服务名只拼接一次
+        self._display_name = functools.lru_cache(maxsize=128)(self._build_display_name)
+        
+        # agent.services() 的短期缓存：(获取时间, 服务字典, (服务名, 地址, 端口) -> 服务ID 索引, 去前缀服务名 -> 端口 索引)
+        # 批量注册/注销时避免每个服务都请求一次
+        self._services_cache: Tuple[float, Dict[str, Dict[str, Any]], Dict[Tuple[str, str, int], str], Dict[str, int]] = (0.0, {}, {}, {})
+        self._services_lock = threading.Lock()
+        
+        # get_service_status 使用的 (获取时间, 服务字典, 服务ID -> 健康检查, 服务名 -> 服务ID) 快照
+        self._status_cache: Tuple[float, Dict[str, Dict[str, Any]], Dict[str, Dict[str, Any]], Dict[str, str]] = (0.0, {}, {}, {})
+        self._status_lock = threading.Lock()
+        
+        # python-consul 底层的 requests.Session（挂载了连接池），shutdown 时关闭
+        self._http_session = None
+        
+        # 批量注册/注销使用的线程池，首次使用时创建，之后重复使用，shutdown 时关闭
+        self._io_pool: Optional[ThreadPoolExecutor] = None
+        
+        # is_available() 的租约：租约到期前直接返回上一次的探测结果
+        self._avail_until: float = 0.0
+        self._avail_value: bool = False
+        self._avail_lock = threading.Lock()
+        
         # 初始化 Consul 管理器
         self.consul_manager = ConsulManager(logger=self.logger)
         
@@ -189,21 +341,13 @@ class ConsulServiceRegistry:
         
         try:
             # 解析 Consul URL
-            if consul_url.startswith("http://"):
-                host_port = consul_url[7:]
-            elif consul_url.startswith("https://"):
-                host_port = consul_url[8:]
-            else:
-                host_port = consul_url
-            
-            if ":" in host_port:
-                host, port = host_port.split(":", 1)
-                port = int(port)
-            else:
-                host, port = host_port, 8500
+            url = urlsplit(consul_url if "://" in consul_url else f"http://{consul_url}")
+            host, port = url.hostname or "127.0.0.1", url.port or 8500
             
             # 检查 Consul 是否运行，如果没有且允许自动启动，则启动它
-            if not self.consul_manager.is_consul_running(host, port):
+            # 探测成功时直接复用探测用的客户端，不再额外做一次连接测试
+            client = self.consul_manager.probe_client(host, port)
+            if client is None:
                 if self.auto_start_consul:
                     self.logger.info("Consul 未运行，尝试自动启动...")
                     if not self.consul_manager.start_consul(dev_mode=True, client_addr="0.0.0.0"):
@@ -214,17 +358,40 @@ class ConsulServiceRegistry:
                     self.logger.warning(f"Consul 未在 {host}:{port} 运行，且未启用自动启动")
                     self.consul = None
                     return
+                
+                client = consul.Consul(host=host, port=port)
             
-            self.consul = consul.Consul(host=host, port=port)
+            self.consul = client
+            self._configure_http_session()
             self.logger.info(f"✅ Consul 客户端初始化成功: {consul_url}")
             
-            # 测试连接
-            self._test_connection()
+            # 上面的探测（或 start_consul 的就绪等待）已经验证过连接，直接建立可用租约
+            self._avail_until = time.monotonic() + 5.0
+            self._avail_value = True
             
         except Exception as e:
             self.logger.error(f"❌ Consul 初始化失败: {e}")
             self.consul = None
     
+    def _configure_http_session(self):
+        """
+        为 python-consul 的 requests.Session 挂载更大的 keep-alive 连接池
+        
+        默认连接池只有 10 个连接，并发批量注册时会反复建立新连接
+        """
+        session = getattr(getattr(self.consul, "http", None), "session", None)
+        if session is None or not HAS_REQUESTS:
+            return
+        
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=32,
+            max_retries=Retry(total=2, backoff_factor=0.1)
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        self._http_session = session
+    
     def _test_connection(self) -> bool:
         """测试 Consul 连接"""
         if not self.consul:
@@ -240,15 +407,141 @@ class ConsulServiceRegistry:
             return False
     
     def is_available(self) -> bool:
-        """检查 Consul 是否可用"""
-        return self.consul is not None and self._test_connection()
+        """
+        检查 Consul 是否可用
+        
+        探测结果按租约缓存：可用时 5 秒内不再探测，不可用时 1 秒后重试
+        """
+        if time.monotonic() < self._avail_until:
+            return self._avail_value
+        
+        # 租约过期时多个线程同时调用，只让一个线程去探测，其余线程等待并复用结果
+        with self._avail_lock:
+            now = time.monotonic()
+            if now < self._avail_until:
+                return self._avail_value
+            
+            available = self.consul is not None and self._test_connection()
+            self._avail_value = available
+            self._avail_until = now + (5.0 if available else 1.0)
+            return available
+    
+    def _get_services_snapshot(self, ttl: float = 1.0) -> Tuple[Dict[str, Dict[str, Any]], Dict[Tuple[str, str, int], str], Dict[str, int]]:
+        """
+        获取 agent.services() 的结果及其索引，ttl 秒内复用上一次的快照
+        
+        索引包括 (服务名, 地址, 端口) -> 服务ID 和 去前缀服务名 -> 端口（仅本实例前缀下的服务）。
+        本实例的注册/注销成功后会通过 _update_services_cache 同步更新快照，因此批量操作只需要一次 HTTP 请求；
+        返回的字典不会被原地修改，调用方也不要修改
+        """
+        fetched_at, services, index, ports = self._services_cache
+        if time.monotonic() - fetched_at < ttl:
+            return services, index, ports
+        
+        # 并发批量操作时只让一个线程去请求，其余线程复用其结果
+        with self._services_lock:
+            fetched_at, services, index, ports = self._services_cache
+            now = time.monotonic()
+            if now - fetched_at < ttl:
+                return services, index, ports
+            
+            services = self.consul.agent.services() or {}
+            index = {}
+            ports = {}
+            for service_id, info in services.items():
+                index[(info.get("Service"), info.get("Address"), info.get("Port"))] = service_id
+                # 按服务名查端口的索引只收录本实例前缀下的服务，避免用其他来源的同名服务的端口拼出错误的服务ID
+                if not self._prefix_dash or service_id.startswith(self._prefix_dash):
+                    ports.setdefault(self._strip_prefix(info.get("Service", "")), info.get("Port"))
+            self._services_cache = (now, services, index, ports)
+            return services, index, ports
+    
+    def _get_services_cached(self, ttl: float = 1.0) -> Dict[str, Dict[str, Any]]:
+        """获取 agent.services() 的结果，ttl 秒内复用上一次的快照"""
+        return self._get_services_snapshot(ttl)[0]
+    
+    def _update_services_cache(self, add: Optional[Dict[str, Any]] = None,
+                               remove_id: Optional[str] = None, service_name: Optional[str] = None):
+        """
+        注册/注销成功后在锁内以写时复制的方式更新 agent.services() 快照
+
+        读者拿到的字典不会被原地修改；快照尚未建立（或已失效）时不需要更新
+        """
+        with self._services_lock:
+            fetched_at, services, index, ports = self._services_cache
+            if not fetched_at:
+                return
+            services, index, ports = dict(services), dict(index), dict(ports)
+            if add is not None:
+                services[add["ID"]] = add
+                index[(add["Service"], add["Address"], add["Port"])] = add["ID"]
+                ports.setdefault(service_name, add["Port"])
+            if remove_id is not None:
+                removed = services.pop(remove_id, None)
+                if removed is not None:
+                    index.pop((removed.get("Service"), removed.get("Address"), removed.get("Port")), None)
+                    if ports.get(service_name) == removed.get("Port"):
+                        ports.pop(service_name)
+            self._services_cache = (fetched_at, services, index, ports)
+    
+    def _invalidate_services_cache(self):
+        """使 agent.services() 快照失效，下次读取时重新请求"""
+        self._services_cache = (0.0, {}, {}, {})
+    
+    def _snapshot(self, ttl: float = 1.0) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, Dict[str, Any]], Dict[str, str]]:
+        """
+        获取 (服务字典, 服务ID -> 健康检查, 服务名 -> 服务ID) 快照，ttl 秒内复用
+        
+        供 get_service_status 使用，查询多个服务的状态时只需要两次 HTTP 请求
+        """
+        fetched_at, services, checks_by_service_id, service_id_by_name = self._status_cache
+        if time.monotonic() - fetched_at < ttl:
+            return services, checks_by_service_id, service_id_by_name
+        
+        # 同 _get_services_snapshot：并发查询时只有一个线程发起请求
+        with self._status_lock:
+            fetched_at, services, checks_by_service_id, service_id_by_name = self._status_cache
+            now = time.monotonic()
+            if now - fetched_at < ttl:
+                return services, checks_by_service_id, service_id_by_name
+            
+            services = self.consul.agent.services() or {}
+            health_checks = self.consul.agent.checks() or {}
+            
+            service_id_by_name = {}
+            for service_id, service_info in services.items():
+                service_id_by_name.setdefault(service_info["Service"], service_id)
+            checks_by_service_id = {}
+            for check_info in health_checks.values():
+                checks_by_service_id.setdefault(check_info.get("ServiceID"), check_info)
+            
+            self._status_cache = (now, services, checks_by_service_id, service_id_by_name)
+            return services, checks_by_service_id, service_id_by_name
+    
+    def _strip_prefix(self, display_name: str) -> str:
+        """去掉 Consul 服务名上的前缀，还原为原始服务名"""
+        if self._prefix_dash and display_name.startswith(self._prefix_dash):
+            return display_name[len(self._prefix_dash):]
+        return display_name
+    
+    def _build_display_name(self, service_name: str) -> str:
+        """拼接 Consul 中使用的服务名（带前缀）"""
+        return f"{self._prefix_dash}{service_name}"
     
     def _generate_service_id(self, service_name: str, host: str, port: int) -> str:
         """生成唯一的服务ID"""
-        if self.service_prefix:
-            return f"{self.service_prefix}-{service_name}-{host}-{port}"
-        else:
-            return f"{service_name}-{host}-{port}"
+        return f"{self._display_name(service_name)}-{host}-{port}"
+    
+    def is_registered(self, service_name: str, host: str, port: int) -> bool:
+        """检查服务是否已以相同的 地址/端口 注册（使用 agent.services() 快照，不额外请求）"""
+        if not self.consul:
+            return False
+        try:
+            services, index, _ = self._get_services_snapshot()
+        except Exception:
+            return False
+        return (self._generate_service_id(service_name, host, port) in services
+                or (self._display_name(service_name), host, port) in index)
     
     def register_service(self, service_name: str, host: str, port: int,
                         health_check_url: Optional[str] = None,
@@ -276,19 +569,17 @@ class ConsulServiceRegistry:
             service_id = self._generate_service_id(service_name, host, port)
             
             # 检查服务是否已经注册（避免重复注册）
-            existing_services = self.consul.agent.services()
+            existing_services, existing_index, _ = self._get_services_snapshot()
             if service_id in existing_services:
                 self.logger.info(f"服务已存在，跳过注册: {service_name} ({service_id})")
                 return True
             
             # 同时检查是否有相同名称的服务已经注册（可能是服务自己注册的）
-            service_display_name = service_name if not self.service_prefix else f"{self.service_prefix}-{service_name}"
-            for existing_id, existing_service in existing_services.items():
-                if (existing_service["Service"] == service_display_name and 
-                    existing_service["Address"] == host and 
-                    existing_service["Port"] == port):
-                    self.logger.info(f"发现相同的服务已存在，跳过注册: {service_name} (已存在ID: {existing_id})")
-                    return True
+            service_display_name = self._display_name(service_name)
+            existing_id = existing_index.get((service_display_name, host, port))
+            if existing_id is not None:
+                self.logger.info(f"发现相同的服务已存在，跳过注册: {service_name} (已存在ID: {existing_id})")
+                return True
             
             # 准备服务注册参数
             register_kwargs = {
@@ -305,22 +596,11 @@ class ConsulServiceRegistry:
                     # 对于某些服务，健康检查可能需要特殊处理
                     if service_name == "ollama_server":
                         # ollama的健康检查端点可能不稳定，使用TCP检查
-                        register_kwargs["check"] = consul.Check.tcp(
-                            host=host,
-                            port=port,
-                            interval="10s",
-                            timeout="5s",
-                            deregister="30s"
-                        )
-                        self.logger.debug(f"使用TCP健康检查: {host}:{port}")
+                        register_kwargs["check"] = _make_check("tcp", host, port)
+                        self.logger.debug("使用TCP健康检查: %s:%s", host, port)
                     else:
-                        register_kwargs["check"] = consul.Check.http(
-                            url=health_check_url,
-                            interval="10s",
-                            timeout="5s",
-                            deregister="30s"
-                        )
-                        self.logger.debug(f"使用HTTP健康检查: {health_check_url}")
+                        register_kwargs["check"] = _make_check("http", health_check_url, 0)
+                        self.logger.debug("使用HTTP健康检查: %s", health_check_url)
                 except Exception as check_error:
                     self.logger.warning(f"添加健康检查失败 {service_name}: {check_error}")
                     # 即使健康检查失败，也尝试注册服务（不带健康检查）
@@ -328,11 +608,24 @@ class ConsulServiceRegistry:
             # 执行注册
             self.consul.agent.service.register(**register_kwargs)
             
+            # 同步更新快照，后续的重复检查无需重新请求
+            self._update_services_cache(add={
+                "ID": service_id,
+                "Service": service_display_name,
+                "Address": host,
+                "Port": port,
+                "Tags": register_kwargs["tags"],
+                "Meta": meta or {}
+            }, service_name=service_name)
+            self._status_cache = (0.0, {}, {}, {})
+            
             self.logger.info(f"✅ 服务注册成功: {service_name} ({service_id}) - {host}:{port}")
             return True
             
         except Exception as e:
             self.logger.error(f"❌ 服务注册失败: {service_name} - {e}")
+            # 操作失败时让租约立即失效，下次 is_available() 重新探测
+            self._avail_until = 0.0
             return False
     
     def deregister_service(self, service_name: str, host: str = "127.0.0.1", 
@@ -355,12 +648,7 @@ class ConsulServiceRegistry:
         try:
             # 如果没有提供端口，尝试从现有服务中查找
             if port is None:
-                services = self.list_services()
-                for service in services:
-                    if service.name.endswith(service_name):
-                        port = service.port
-                        break
-                
+                port = self._get_services_snapshot()[2].get(service_name)
                 if port is None:
                     self.logger.warning(f"无法确定服务端口: {service_name}")
                     return False
@@ -369,12 +657,15 @@ class ConsulServiceRegistry:
             
             # 执行注销
             self.consul.agent.service.deregister(service_id)
+            self._update_services_cache(remove_id=service_id, service_name=service_name)
+            self._status_cache = (0.0, {}, {}, {})
             
             self.logger.info(f"✅ 服务注销成功: {service_name} ({service_id})")
             return True
             
         except Exception as e:
             self.logger.error(f"❌ 服务注销失败: {service_name} - {e}")
+            self._avail_until = 0.0
             return False
     
     def get_service_status(self, service_name: str) -> Dict[str, Any]:
@@ -391,11 +682,10 @@ class ConsulServiceRegistry:
             return {"error": "Consul 不可用"}
         
         try:
-            full_service_name = service_name if not self.service_prefix else f"{self.service_prefix}-{service_name}"
+            full_service_name = self._display_name(service_name)
             
             # 获取服务信息
-            services = self.consul.agent.services()
-            health_checks = self.consul.agent.checks()
+            services, checks_by_service_id, service_id_by_name = self._snapshot()
             
             service_status = {
                 "registered": False,
@@ -405,18 +695,16 @@ class ConsulServiceRegistry:
             }
             
             # 查找服务
-            for service_id, service_info in services.items():
-                if service_info["Service"] == full_service_name:
-                    service_status["registered"] = True
-                    service_status["service_info"] = service_info
-                    
-                    # 查找健康检查
-                    for check_id, check_info in health_checks.items():
-                        if check_info.get("ServiceID") == service_id:
-                            service_status["healthy"] = check_info["Status"] == "passing"
-                            service_status["health_info"] = check_info
-                            break
-                    break
+            service_id = service_id_by_name.get(full_service_name)
+            if service_id is not None:
+                service_status["registered"] = True
+                service_status["service_info"] = services[service_id]
+                
+                # 查找健康检查
+                check_info = checks_by_service_id.get(service_id)
+                if check_info is not None:
+                    service_status["healthy"] = check_info["Status"] == "passing"
+                    service_status["health_info"] = check_info
             
             return service_status
             
@@ -435,12 +723,13 @@ class ConsulServiceRegistry:
             return []
         
         try:
-            services = self.consul.agent.services()
+            services = self._get_services_cached()
             service_list = []
+            prefix_dash = self._prefix_dash
             
             for service_id, service_info in services.items():
                 # 如果没有前缀，返回所有服务；如果有前缀，只返回我们管理的服务
-                if not self.service_prefix or service_info["Service"].startswith(self.service_prefix):
+                if not prefix_dash or service_info["Service"].startswith(prefix_dash):
                     service_list.append(ServiceInfo(
                         name=service_info["Service"],
                         service_id=service_id,
@@ -472,16 +761,16 @@ class ConsulServiceRegistry:
         try:
             if service_name:
                 # 查找特定服务
-                full_service_name = service_name if not self.service_prefix else f"{self.service_prefix}-{service_name}"
+                full_service_name = self._display_name(service_name)
                 _, service_data = self.consul.health.service(full_service_name, passing=False)  # 不仅仅是健康的服务
             else:
                 # 获取所有服务（不仅仅是健康的）
-                services = self.consul.agent.services()
+                services = self._get_services_cached()
                 service_data = []
                 
                 # 转换为健康检查格式以保持兼容性
                 for service_id, service_info in services.items():
-                    if not self.service_prefix or service_info["Service"].startswith(self.service_prefix):
+                    if not self._prefix_dash or service_info["Service"].startswith(self._prefix_dash):
                         service_data.append({
                             "Service": {
                                 "Service": service_info["Service"],
@@ -511,6 +800,60 @@ class ConsulServiceRegistry:
             self.logger.error(f"❌ 服务发现失败: {e}")
             return []
     
+    def watch_services(self, callback, wait: str = "5m", min_interval: float = 1.0,
+                       stop_event: Optional[threading.Event] = None):
+        """
+        使用 Consul 阻塞查询监听服务目录变化，代替周期性轮询 list_services/discover_services
+        
+        只有目录发生变化（或等待超时）时服务端才会返回，回调之间至少间隔 min_interval 秒。
+        该方法会阻塞当前线程，通常放在后台线程中运行
+        
+        Args:
+            callback: 回调函数，参数为 {服务名: 标签列表}（已按前缀过滤）
+            wait: 单次阻塞查询的最长等待时间
+            min_interval: 两次回调之间的最小间隔（秒）
+            stop_event: 设置后在下一次查询返回时退出
+        """
+        if not self.consul:
+            return
+        
+        index = None
+        last_callback = 0.0
+        retry_delay = 1.0
+        
+        while stop_event is None or not stop_event.is_set():
+            try:
+                new_index, services = self.consul.catalog.services(index=index, wait=wait)
+            except Exception as e:
+                self.logger.warning(f"⚠️ 监听服务目录失败，{retry_delay:.0f} 秒后重试: {e}")
+                if stop_event is not None:
+                    stop_event.wait(retry_delay)
+                else:
+                    time.sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, 30.0)
+                index = None
+                continue
+            
+            retry_delay = 1.0
+            # index 未变化说明只是等待超时，目录没有变化
+            if new_index == index:
+                continue
+            index = new_index
+            
+            # 限制回调频率，避免服务频繁抖动时回调风暴
+            delay = last_callback + min_interval - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            last_callback = time.monotonic()
+            
+            if self._prefix_dash:
+                services = {name: tags for name, tags in services.items() if name.startswith(self._prefix_dash)}
+            
+            try:
+                callback(services)
+            except Exception as e:
+                self.logger.error(f"❌ 服务目录回调执行失败: {e}")
+    
     def register_all_services(self, service_states: Dict[str, Dict]) -> Dict[str, bool]:
         """
         批量注册所有服务
@@ -522,6 +865,7 @@ class ConsulServiceRegistry:
             Dict[str, bool]: 每个服务的注册结果
         """
         results = {}
+        work = []
         
         for service_name, service_info in service_states.items():
             port = service_info.get("port")
@@ -533,16 +877,44 @@ class ConsulServiceRegistry:
             # 获取健康检查URL（如果有的话）
             health_check_url = self._get_default_health_check_url(service_name, port)
             
-            results[service_name] = self.register_service(
-                service_name=service_name,
-                host="127.0.0.1",
-                port=port,
-                health_check_url=health_check_url,
-                tags=["external-service", service_info.get("type", "unknown")]
-            )
+            work.append((service_name, {
+                "service_name": service_name,
+                "host": "127.0.0.1",
+                "port": port,
+                "health_check_url": health_check_url,
+                "tags": ["external-service", service_info.get("type", "unknown")]
+            }))
         
+        results.update(self._run_concurrently(self.register_service, work))
+        return {service_name: results[service_name] for service_name in service_states}
+    
+    def _run_concurrently(self, func, work: List[Tuple[str, Dict[str, Any]]]) -> Dict[str, bool]:
+        """并发执行一批相互独立的注册/注销请求，返回 {服务名: 结果}"""
+        if not work:
+            return {}
+        if len(work) == 1:
+            name, kwargs = work[0]
+            futures = [(name, None, kwargs)]
+        else:
+            pool = self._get_io_pool()
+            futures = [(name, pool.submit(func, **kwargs), kwargs) for name, kwargs in work]
+        
+        # 单个服务的请求抛出异常时只把该服务记为失败，不影响同一批次的其他服务
+        results = {}
+        for name, future, kwargs in futures:
+            try:
+                results[name] = future.result() if future is not None else func(**kwargs)
+            except Exception as e:
+                self.logger.warning(f"处理服务 {name} 时出错: {e}")
+                results[name] = False
         return results
     
+    def _get_io_pool(self) -> ThreadPoolExecutor:
+        """返回共用的 I/O 线程池，首次使用时创建"""
+        if self._io_pool is None:
+            self._io_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="consul-io")
+        return self._io_pool
+    
     def _get_default_health_check_url(self, service_name: str, port: int) -> Optional[str]:
         """
         获取服务的默认健康检查URL
@@ -554,20 +926,8 @@ class ConsulServiceRegistry:
         Returns:
             Optional[str]: 健康检查URL
         """
-        # 预定义的健康检查URL模式
-        health_check_patterns = {
-            "Consul": f"http://127.0.0.1:{port}/v1/status/leader",
-            "ollama_server": f"http://127.0.0.1:{port}/api/tags",
-            "GPTSoVits_server": f"http://127.0.0.1:{port}/health",
-            "SenseVoice_server": f"http://127.0.0.1:{port}/health",
-            "MicroServiceGateway": f"http://127.0.0.1:{port}/health",
-            "APIGateway": f"http://127.0.0.1:{port}/health",
-            "MySQLAgent": f"http://127.0.0.1:{port}/health",
-            "MySQLService": f"http://127.0.0.1:{port}/health", 
-            "UserService": f"http://127.0.0.1:{port}/health"
-        }
-        
-        return health_check_patterns.get(service_name)
+        template = _HC_TEMPLATES.get(service_name)
+        return template.format(port=port) if template else None
 
     def deregister_all_services(self, service_states: Dict[str, Dict]) -> Dict[str, bool]:
         """
@@ -579,17 +939,16 @@ class ConsulServiceRegistry:
         Returns:
             Dict[str, bool]: 每个服务的注销结果
         """
-        results = {}
+        work = [
+            (service_name, {
+                "service_name": service_name,
+                "host": "127.0.0.1",
+                "port": service_info.get("port")
+            })
+            for service_name, service_info in service_states.items()
+        ]
         
-        for service_name, service_info in service_states.items():
-            port = service_info.get("port")
-            results[service_name] = self.deregister_service(
-                service_name=service_name,
-                host="127.0.0.1",
-                port=port
-            )
-        
-        return results
+        return self._run_concurrently(self.deregister_service, work)
     
     def shutdown(self, deregister_services: bool = True):
         """
@@ -604,13 +963,12 @@ class ConsulServiceRegistry:
             try:
                 # 注销所有已注册的服务
                 if self.consul:
-                    registered_services = self._get_registered_services()
-                    for service in registered_services:
-                        service_id = service.get("ID", "")
-                        # 如果没有前缀，注销所有服务；如果有前缀，只注销我们管理的服务
-                        if not self.service_prefix or service_id.startswith(f"{self.service_prefix}-"):
-                            self.logger.info(f"注销服务: {service_id}")
-                            self.consul.agent.service.deregister(service_id)
+                    # 如果没有前缀，注销所有服务；如果有前缀，只注销我们管理的服务
+                    service_ids = [
+                        service.get("ID", "") for service in self._get_registered_services()
+                        if not self._prefix_dash or service.get("ID", "").startswith(self._prefix_dash)
+                    ]
+                    self._deregister_ids(service_ids, timeout=5.0)
             except Exception as e:
                 self.logger.warning(f"注销服务时出错: {e}")
 
@@ -621,15 +979,61 @@ class ConsulServiceRegistry:
         except Exception as e:
             self.logger.warning(f"停止 Consul 进程时出错: {e}")
         
+        if self._io_pool is not None:
+            self._io_pool.shutdown(wait=False, cancel_futures=True)
+            self._io_pool = None
+        
+        if self._http_session is not None:
+            self._http_session.close()
+            self._http_session = None
+        
         self.logger.info("Consul 服务注册器已关闭")
     
+    def _deregister_ids(self, service_ids: List[str], timeout: float):
+        """并发注销一批服务ID，总耗时不超过 timeout 秒，超时未完成的请求直接放弃"""
+        if not service_ids:
+            return
+        
+        pool = self._get_io_pool()
+        try:
+            futures = {pool.submit(self._deregister_id, service_id, timeout): service_id
+                       for service_id in service_ids}
+            done, not_done = wait_futures(futures, timeout=timeout)
+            for future in done:
+                if future.exception() is not None:
+                    self.logger.warning(f"注销服务 {futures[future]} 时出错: {future.exception()}")
+            if not_done:
+                self.logger.warning(f"注销服务超时，放弃 {len(not_done)} 个未完成的请求")
+                for future in not_done:
+                    future.cancel()
+        finally:
+            self._invalidate_services_cache()
+    
+    def _deregister_id(self, service_id: str, timeout: float):
+        """
+        注销单个服务ID，HTTP 请求带超时
+        
+        python-consul 的请求不带 timeout，Consul 无响应时工作线程会一直阻塞，
+        解释器退出时还要等待它结束；能拿到底层 session 时直接发带超时的请求
+        """
+        self.logger.info(f"注销服务: {service_id}")
+        http = getattr(self.consul, "http", None)
+        if self._http_session is None or http is None:
+            self.consul.agent.service.deregister(service_id)
+            return
+        response = self._http_session.put(
+            http.uri(f"/v1/agent/service/deregister/{service_id}"),
+            verify=http.verify, cert=http.cert, timeout=timeout
+        )
+        response.raise_for_status()
+    
     def _get_registered_services(self) -> List[Dict[str, Any]]:
         """获取已注册的服务列表"""
         if not self.consul:
             return []
         
         try:
-            services = self.consul.agent.services()
+            services = self._get_services_cached()
             return list(services.values()) if services else []
         except Exception as e:
             self.logger.warning(f"获取已注册服务列表失败: {e}")
@@ -661,6 +1065,13 @@ class ConsulIntegrationManager:
         # 等待服务端口准备好的超时时间（秒），默认 120 秒
         self.register_wait_timeout = int(consul_config.get("register_wait_timeout", 120))
         
+        # 最近一次确认端口可连接的时间：(host, port) -> monotonic 时间戳，短时间内不重复探测
+        self._port_ready: Dict[Tuple[str, int], float] = {}
+        self._port_ready_ttl = 2.0
+        # 等待超时的端口：(host, port) -> 失效时间，期间再次等待直接判定失败，不再阻塞整个超时
+        self._port_failed: Dict[Tuple[str, int], float] = {}
+        self._port_failed_ttl = 9.0
+        
         # 初始化 Consul 注册器
         self.registry = ConsulServiceRegistry(
             consul_url=consul_config.get("url", "http://127.0.0.1:8500"),
@@ -697,15 +1108,25 @@ class ConsulIntegrationManager:
         if not port:
             self.logger.warning(f"服务 {service_name} 缺少端口信息，跳过 Consul 注册")
             return False
+        port_num = _valid_port(port)
+        if port_num is None:
+            self.logger.warning(f"服务 {service_name} 的端口 {port} 无效，跳过 Consul 注册")
+            return False
+
+        # 已经注册过（例如重复执行 register 命令）时无需再等待端口和重新注册，
+        # 避免改变 Consul 的服务索引
+        if self.registry.is_registered(service_name, "127.0.0.1", port_num):
+            self.logger.info(f"服务已存在，跳过注册: {service_name}")
+            return True
 
         # 获取健康检查URL（如果有的话）
-        health_check_url = self._get_health_check_url(service_name, port)
+        health_check_url = self.registry._get_default_health_check_url(service_name, port)
 
         # 如果服务需要较长时间启动，先等待端口可连接再注册到 Consul。
         # 这可以避免服务尚未就绪被 Consul 健康检查判定为不通过并在短时间后自动注销的问题。
         try:
-            wait_ok = self._wait_for_port("127.0.0.1", int(port), timeout=self.register_wait_timeout)
-        except Exception:
+            wait_ok = self._wait_for_port("127.0.0.1", port_num, timeout=self.register_wait_timeout)
+        except (OSError, ValueError, OverflowError):
             wait_ok = False
 
         if not wait_ok:
@@ -721,6 +1142,69 @@ class ConsulIntegrationManager:
             tags=["external-service", service_info.get("type", "unknown")]
         )
 
+    def on_services_started(self, services: Dict[str, Dict[str, Any]]) -> Dict[str, bool]:
+        """
+        批量版本的 on_service_started
+
+        所有服务的端口一起等待，就绪的服务再并发注册，总耗时约等于最慢的那个服务；
+        单个服务失败不影响其他服务
+
+        Args:
+            services: 服务名 -> 服务信息
+
+        Returns:
+            Dict[str, bool]: 每个服务的处理结果
+        """
+        results = {service_name: True for service_name in services}
+        if not self.auto_register or not self.registry.is_available():
+            return results
+        
+        ports: Dict[str, int] = {}
+        for service_name, service_info in services.items():
+            # 跳过Consul服务，因为它在开发模式下会自动注册自己
+            if service_name.lower() == "consul":
+                self.logger.info(f"跳过Consul服务注册，它会自动注册自己")
+                continue
+            port = _valid_port(service_info.get("port"))
+            if port is None:
+                self.logger.warning(f"服务 {service_name} 缺少有效的端口信息，跳过 Consul 注册")
+                results[service_name] = False
+                continue
+            ports[service_name] = port
+        
+        # 已经以相同端口注册的服务不再等待端口、也不重新注册，避免改变 Consul 的服务索引
+        registered = set()
+        for service_name, port in ports.items():
+            try:
+                if self.registry.is_registered(service_name, "127.0.0.1", port):
+                    registered.add(service_name)
+            except Exception as e:
+                self.logger.warning(f"查询服务 {service_name} 的注册状态失败: {e}")
+        for service_name in registered:
+            self.logger.info(f"服务已存在，跳过注册: {service_name}")
+        pending_ports = {port for service_name, port in ports.items() if service_name not in registered}
+        if not pending_ports:
+            return results
+        
+        try:
+            ready = self._wait_for_ports("127.0.0.1", list(pending_ports), timeout=self.register_wait_timeout)
+        except (OSError, OverflowError):
+            ready = {}
+        
+        ready_services = {}
+        for service_name, port in ports.items():
+            if service_name in registered:
+                continue
+            if ready.get(port):
+                ready_services[service_name] = services[service_name]
+            else:
+                self.logger.warning(f"服务 {service_name} 在 {self.register_wait_timeout}s 内未监听端口 {port}，跳过 Consul 注册")
+                results[service_name] = False
+        
+        if ready_services:
+            results.update(self.registry.register_all_services(ready_services))
+        return results
+
     def _wait_for_port(self, host: str, port: int, timeout: int = 120, interval: float = 1.0) -> bool:
         """
         等待指定 TCP 端口可连接。
@@ -729,19 +1213,153 @@ class ConsulIntegrationManager:
             host: 主机（通常为 127.0.0.1）
             port: 端口号
             timeout: 最大等待秒数
-            interval: 两次尝试间隔秒数
+            interval: 两次尝试的最大间隔秒数
 
         Returns:
             bool: 如果端口在超时时间内可连接则返回 True，否则 False
         """
-        deadline = time.time() + timeout
-        while time.time() < deadline:
-            try:
-                with socket.create_connection((host, port), timeout=interval):
-                    return True
-            except Exception:
-                time.sleep(interval)
-        return False
+        return self._wait_for_ports(host, [port], timeout=timeout, interval=interval)[port]
+
+    def _wait_for_ports(self, host: str, ports: List[int], timeout: int = 120,
+                        interval: float = 1.0) -> Dict[int, bool]:
+        """
+        在当前线程内同时等待多个 TCP 端口可连接
+
+        每一轮对所有尚未就绪的端口发起非阻塞 connect，用 selectors 统一等待结果，
+        N 个服务的等待耗时约等于最慢的那个，而不是逐个累加，也不需要每个服务占用一个线程。
+        探测间隔从 200ms 起指数增长到 interval，并带 ±20% 抖动，服务很快就绪时能及时发现。
+
+        Returns:
+            Dict[int, bool]: 端口 -> 是否在超时时间内可连接
+        """
+        now = time.monotonic()
+        result: Dict[int, bool] = {}
+        pending = set()
+        for port in ports:
+            ready_at = self._port_ready.get((host, port))
+            if ready_at is not None and now - ready_at < self._port_ready_ttl:
+                result[port] = True
+            elif now < self._port_failed.get((host, port), 0.0):
+                result[port] = False
+            else:
+                result[port] = False
+                pending.add(port)
+        
+        family = socket.AF_INET6 if ":" in host else socket.AF_INET
+        deadline = now + timeout
+        delay = min(0.2, interval)
+        selector = selectors.DefaultSelector()
+        try:
+            while pending:
+                round_start = time.monotonic()
+                remaining = deadline - round_start
+                if remaining <= 0:
+                    break
+                
+                ready = []
+                failed = []
+                for port in pending:
+                    sock = socket.socket(family, socket.SOCK_STREAM)
+                    try:
+                        sock.setblocking(False)
+                        err = sock.connect_ex((host, port))
+                    except (OSError, OverflowError) as e:
+                        # 单个端口无法探测时只判定该端口失败，不影响其他端口
+                        sock.close()
+                        self.logger.warning(f"探测端口 {host}:{port} 失败: {e}")
+                        failed.append(port)
+                        continue
+                    except BaseException:
+                        sock.close()
+                        raise
+                    if err == 0:
+                        ready.append(port)
+                        sock.close()
+                    elif err in (errno.EINPROGRESS, errno.EWOULDBLOCK):
+                        selector.register(sock, selectors.EVENT_WRITE, port)
+                    else:
+                        sock.close()
+                
+                # 等待进行中的连接完成，最多一个探测间隔
+                round_end = round_start + min(delay * random.uniform(0.8, 1.2), remaining)
+                while selector.get_map():
+                    wait = round_end - time.monotonic()
+                    if wait <= 0:
+                        break
+                    for key, _ in selector.select(wait):
+                        sock = key.fileobj
+                        if sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) == 0:
+                            ready.append(key.data)
+                        selector.unregister(sock)
+                        sock.close()
+                for key in list(selector.get_map().values()):
+                    selector.unregister(key.fileobj)
+                    key.fileobj.close()
+                
+                for port in failed:
+                    pending.discard(port)
+                    self._port_failed[(host, port)] = time.monotonic() + self._port_failed_ttl
+                
+                if ready:
+                    ready_at = time.monotonic()
+                    for port in ready:
+                        pending.discard(port)
+                        result[port] = True
+                        self._port_ready[(host, port)] = ready_at
+                        self._port_failed.pop((host, port), None)
+                
+                if pending:
+                    wait = round_end - time.monotonic()
+                    if wait > 0:
+                        time.sleep(wait)
+                    delay = min(delay * 2, interval)
+        finally:
+            # 探测中途抛出异常时，已注册到 selector 的非阻塞 socket 也要全部关闭
+            for key in list(selector.get_map().values()):
+                key.fileobj.close()
+            selector.close()
+        
+        if pending:
+            failed_until = time.monotonic() + self._port_failed_ttl
+            for port in pending:
+                self._port_failed[(host, port)] = failed_until
+        return result
+    
+    def invalidate(self, port: int, host: str = "127.0.0.1"):
+        """丢弃某个端口缓存的探测结果（服务启动或停止后调用）"""
+        key = (host, int(port))
+        self._port_ready.pop(key, None)
+        self._port_failed.pop(key, None)
+    
+    def on_services_stopped(self, services: Dict[str, Dict[str, Any]]) -> Dict[str, bool]:
+        """
+        批量版本的 on_service_stopped，各服务的注销请求并发执行
+
+        Args:
+            services: 服务名 -> 服务信息
+
+        Returns:
+            Dict[str, bool]: 每个服务的处理结果
+        """
+        results = {service_name: True for service_name in services}
+        if not self.auto_register or not self.registry.is_available():
+            return results
+        
+        to_deregister = {}
+        for service_name, service_info in services.items():
+            # 跳过Consul服务，因为它在开发模式下会自动管理自己
+            if service_name.lower() == "consul":
+                self.logger.info(f"跳过Consul服务注销，它会自动管理自己")
+                continue
+            port = service_info.get("port")
+            # 服务已停止，之前的端口探测结果不再有效
+            if port and str(port).isdigit():
+                self.invalidate(port)
+            to_deregister[service_name] = service_info
+        
+        if to_deregister:
+            results.update(self.registry.deregister_all_services(to_deregister))
+        return results
     
     def on_service_stopped(self, service_name: str, service_info: Dict[str, Any]) -> bool:
         """
@@ -763,34 +1381,11 @@ class ConsulIntegrationManager:
             return True
         
         port = service_info.get("port")
+        # 服务已停止，之前的端口探测结果不再有效
+        if port:
+            self.invalidate(port)
         return self.registry.deregister_service(
             service_name=service_name,
             host="127.0.0.1",
             port=port
         )
-    
-    def _get_health_check_url(self, service_name: str, port: int) -> Optional[str]:
-        """
-        获取服务的健康检查URL
-        
-        Args:
-            service_name: 服务名称
-            port: 服务端口
-            
-        Returns:
-            Optional[str]: 健康检查URL
-        """
-        # 预定义的健康检查URL模式
-        health_check_patterns = {
-            "Consul": f"http://127.0.0.1:{port}/v1/status/leader",
-            "ollama_server": f"http://127.0.0.1:{port}/api/tags",
-            "GPTSoVits_server": f"http://127.0.0.1:{port}/health",
-            "SenseVoice_server": f"http://127.0.0.1:{port}/health",
-            "MicroServiceGateway": f"http://127.0.0.1:{port}/health",
-            "APIGateway": f"http://127.0.0.1:{port}/health",
-            "MySQLAgent": f"http://127.0.0.1:{port}/health",
-            "MySQLService": f"http://127.0.0.1:{port}/health",
-            "UserService": f"http://127.0.0.1:{port}/health"
-        }
-        
-        return health_check_patterns.get(service_name)
@@ -18,29 +18,41 @@
 """
 
 import os
+import re
 import sys
 import json
 import time
+import hashlib
 import argparse
 import signal
+import shutil
 from typing import Dict, List, Optional, Tuple
 from pathlib import Path
 
-# 添加当前目录到路径（用于独立项目）
-current_dir = Path(__file__).parent
-sys.path.insert(0, str(current_dir))
+# 可选依赖在模块加载时导入一次，不可用时为 None
+try:
+    import psutil
+except ImportError:
+    psutil = None
 
-# ---------- 简化辅助函数 (module-level helpers) ----------
-def _safe_import(name: str):
-    try:
-        return __import__(name)
-    except Exception:
-        return None
+try:
+    import yaml
+except ImportError:
+    yaml = None
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# 添加当前目录到路径（用于独立项目）；直接运行脚本时该目录已在 sys.path[0]，无需重复插入
+current_dir = Path(__file__).resolve().parent
+if str(current_dir) not in sys.path:
+    sys.path.insert(0, str(current_dir))
 
+# ---------- 简化辅助函数 (module-level helpers) ----------
 def _copy_file(src, dst, logger=None) -> bool:
     try:
-        import shutil
         shutil.copy2(str(src), str(dst))
         if logger:
             logger.info(f"复制配置文件: {src} -> {dst}")
@@ -51,48 +63,146 @@ def _copy_file(src, dst, logger=None) -> bool:
         return False
 
 
+# 从健康检查 URL 中提取端口，例如 http://127.0.0.1:8500/v1/status/leader
+_PORT_RE = re.compile(r':(\d+)/')
+
 def _load_yaml(path, logger=None):
-    yaml = _safe_import('yaml')
+    """解析 yaml 文件，与 ProcessRunner 共用同一份按 mtime/size 失效的解析缓存，调用方不要修改返回值"""
     if yaml is None:
         if logger:
             logger.warning("yaml 模块不可用，无法解析配置文件")
         return None
     try:
-        with open(path, 'r', encoding='utf-8') as f:
-            return yaml.safe_load(f)
+        return load_service_config(path)
+    except FileNotFoundError:
+        # 配置文件不存在属于正常情况，由调用方决定如何回退
+        return None
     except Exception as e:
         if logger:
             logger.warning(f"加载 yaml 失败 {path}: {e}")
         return None
 
 
+def _collect_process_tree(pid: int) -> list:
+    """返回 pid 对应进程及其全部子进程的 psutil.Process 列表；进程不存在（或未安装 psutil）时返回空列表"""
+    if not pid or psutil is None:
+        return []
+    try:
+        p = psutil.Process(pid)
+        return [p] + p.children(recursive=True)
+    except psutil.NoSuchProcess:
+        return []
+
+
+def _signal_process_group(pid: int, sig: int = signal.SIGTERM) -> bool:
+    """
+    pid 是独立进程组的组长时（ProcessRunner 以 start_new_session 启动服务），用一次 killpg 向整个组发送信号
+
+    pid 不存在、不是组长或与本进程同组时返回 False，由调用方退回逐个进程处理
+    """
+    try:
+        pgid = os.getpgid(pid)
+        if pgid != pid or pgid == os.getpgrp():
+            return False
+        os.killpg(pgid, sig)
+        return True
+    except OSError:
+        return False
+
+
+def _live_groups(pgids) -> set:
+    """返回 pgids 中仍有存活（非僵尸）成员的进程组"""
+    pgids = set(pgids)
+    if not pgids:
+        return set()
+    alive = set()
+    try:
+        with os.scandir('/proc') as it:
+            for entry in it:
+                if not entry.name.isdigit():
+                    continue
+                try:
+                    with open(f'/proc/{entry.name}/stat', 'rb') as f:
+                        stat = f.read()
+                    # 最后一个 ')' 之后依次为 state ppid pgrp ...
+                    state, _, pgrp = stat[stat.rindex(b')') + 2:].split(None, 3)[:3]
+                except (OSError, ValueError):
+                    continue
+                if state not in (b'Z', b'X') and int(pgrp) in pgids:
+                    alive.add(int(pgrp))
+        return alive
+    except OSError:
+        pass
+    # 没有 /proc：killpg(pgid, 0) 成功说明组内仍有进程
+    for pgid in pgids:
+        try:
+            os.killpg(pgid, 0)
+            alive.add(pgid)
+        except ProcessLookupError:
+            pass
+        except OSError:
+            alive.add(pgid)
+    return alive
+
+
+def _terminate_processes(procs, timeout: float = 3, groups=()) -> None:
+    """向一批 psutil.Process 发送 SIGTERM，统一等待 timeout 秒，仍存活的再 SIGKILL
+
+    groups 为已经通过 _signal_process_group 发送过 SIGTERM 的进程组（组长 pid），
+    等待组内所有成员退出，超时后只向仍有存活成员的组发送 SIGKILL；这部分不依赖 psutil
+    """
+    if not procs and not groups:
+        return
+    deadline = time.monotonic() + timeout
+    for proc in procs:
+        try:
+            proc.terminate()
+        except Exception:
+            pass
+
+    pending = _live_groups(groups)
+    while pending:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        time.sleep(min(0.1, remaining))
+        pending = _live_groups(pending)
+
+    if procs:
+        gone, alive = psutil.wait_procs(procs, timeout=max(0.0, deadline - time.monotonic()))
+        for a in alive:
+            try:
+                a.kill()
+            except Exception:
+                pass
+    for pgid in pending:
+        try:
+            os.killpg(pgid, signal.SIGKILL)
+        except OSError:
+            pass
+
+
 def _terminate_process_tree(pid: int, logger=None) -> bool:
     """尝试优雅终止指定 pid 的进程树，返回是否尝试过终止（不保证已停止）。"""
     if not pid:
         return False
-    try:
-        import psutil
-    except Exception:
-        psutil = None
+
+    # 独立进程组：一次 killpg 通知整棵进程树，不需要递归遍历子进程
+    if _signal_process_group(pid):
+        try:
+            _terminate_processes([], groups=(pid,))
+        except Exception as e:
+            if logger:
+                logger.warning(f"等待进程组退出失败 pgid={pid}: {e}")
+        return True
 
     if psutil is not None:
         try:
-            p = psutil.Process(pid)
-            procs = [p] + p.children(recursive=True)
-            for proc in procs:
-                try:
-                    proc.terminate()
-                except Exception:
-                    pass
-            gone, alive = psutil.wait_procs(procs, timeout=3)
-            for a in alive:
-                try:
-                    a.kill()
-                except Exception:
-                    pass
+            procs = _collect_process_tree(pid)
+            if not procs:
+                return False
+            _terminate_processes(procs)
             return True
-        except psutil.NoSuchProcess:
-            return False
         except Exception as e:
             if logger:
                 logger.warning(f"通过 psutil 终止进程树失败 pid={pid}: {e}")
@@ -100,24 +210,117 @@ def _terminate_process_tree(pid: int, logger=None) -> bool:
     else:
         try:
             os.kill(pid, signal.SIGTERM)
-            return True
         except Exception as e:
             if logger:
                 logger.warning(f"psutil 未安装且 kill(pid) 失败 pid={pid}: {e}")
             return False
+        # 没有 psutil 也要在超时后升级为 SIGKILL
+        deadline = time.monotonic() + 3
+        while not _is_defunct(pid) and time.monotonic() < deadline:
+            time.sleep(0.1)
+        if not _is_defunct(pid):
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except OSError:
+                pass
+        return True
+
+
+def _find_pids_by_cmdline(script: str, args=(), exclude=()) -> List[int]:
+    """
+    扫描 /proc/<pid>/cmdline，返回命令行与 script + args 完全一致的进程 pid（psutil 不可用时的退路，不需要 fork pgrep）
+
+    argv[0] 为 script（script 不含路径时也匹配 PATH 中解析出的同名可执行文件），或 argv[1] 为 script
+    （通过解释器启动的脚本），其余参数与 args 逐个相同；仅包含 script 子串的其他命令（如编辑器打开同名文件）不会匹配
+    """
+    if not script:
+        return []
+    script_b = os.fsencode(script)
+    bare = b'/' not in script_b
+    tail = [os.fsencode(str(a)) for a in args]
+    pids = []
+    try:
+        with os.scandir('/proc') as it:
+            for entry in it:
+                if not entry.name.isdigit():
+                    continue
+                pid = int(entry.name)
+                if pid in exclude:
+                    continue
+                try:
+                    with open(f'/proc/{entry.name}/cmdline', 'rb') as f:
+                        cmdline = f.read()
+                except OSError:
+                    continue
+                # 参数之间以 NUL 分隔，末尾还有一个 NUL
+                argv = cmdline.split(b'\0')[:-1]
+                if len(argv) == len(tail) + 1 and argv[1:] == tail:
+                    exe = argv[0]
+                    if exe == script_b or (bare and exe.rsplit(b'/', 1)[-1] == script_b):
+                        pids.append(pid)
+                elif len(argv) == len(tail) + 2 and argv[1] == script_b and argv[2:] == tail:
+                    pids.append(pid)
+    except OSError:
+        return []
+    return pids
+
+
+def _live_pids() -> Optional[set]:
+    """一次读取 /proc 得到当前存在的 pid 集合；没有 /proc 时退回 psutil.pids()，都不可用时返回 None"""
+    try:
+        with os.scandir('/proc') as it:
+            return {int(entry.name) for entry in it if entry.name.isdigit()}
+    except OSError:
+        pass
+    if psutil is not None:
+        try:
+            return set(psutil.pids())
+        except Exception:
+            pass
+    return None
+
+
+def _is_defunct(pid: int) -> bool:
+    """pid 已退出时返回 True：僵尸进程在被回收前仍会出现在 /proc 中，kill(pid, 0) 也会成功，需要读取状态字段区分"""
+    try:
+        with open(f'/proc/{pid}/stat', 'rb') as f:
+            stat = f.read()
+        # comm 字段可能包含空格和括号，状态字段位于最后一个 ')' 之后
+        end = stat.rindex(b')')
+        return stat[end + 2:end + 3] in (b'Z', b'X')
+    except FileNotFoundError:
+        return True
+    except (OSError, ValueError):
+        pass
+    if psutil is not None:
+        try:
+            return psutil.Process(pid).status() == psutil.STATUS_ZOMBIE
+        except psutil.NoSuchProcess:
+            return True
+        except Exception:
+            pass
+    return False
+
 
 # ---------- end helpers ----------
 
 # 旧的 `legacy` 实现已弃用。低层进程管理逻辑已抽取到 `Module.Utils.process_runner.ProcessRunner`。
-from Module.Utils.process_runner import ProcessRunner
+from Module.Utils.process_runner import ProcessRunner, load_service_config
 
-# 导入Consul集成模块
-try:
-    from consul_integration import ConsulIntegrationManager
-    HAS_CONSUL_INTEGRATION = True
-except ImportError as e:
-    print(f"警告：Consul集成模块导入失败: {e}")
-    HAS_CONSUL_INTEGRATION = False
+
+def _import_consul_integration(logger=None):
+    """
+    按需导入 Consul 集成模块（会连带导入 python-consul/requests），失败时返回 None
+
+    只有配置中启用了 Consul 才会调用，未启用时命令行启动不必承担这部分导入开销
+    """
+    try:
+        from consul_integration import ConsulIntegrationManager
+        return ConsulIntegrationManager
+    except ImportError as e:
+        if logger:
+            logger.warning(f"Consul集成模块导入失败: {e}")
+        return None
 
 from Module.Utils.Logger import setup_logger
 
@@ -143,14 +346,24 @@ class ExternalServiceManager:
         
         # 初始化新的最小化外部服务管理器（替代 legacy）
         try:
-            self.manager = ProcessRunner()
+            self.manager = ProcessRunner(logger=self.logger)
+            # 管理器可选能力只查找一次，不支持时为 None
+            self._status_fn = getattr(self.manager, 'get_service_status', None)
+            self._stop_all_fn = getattr(self.manager, 'stop_all_services', None)
+            self._stop_one_fn = getattr(self.manager, 'stop_service', None)
             self.logger.info("✅ 外部服务管理器（新实现）初始化成功")
         except Exception as e:
             self.logger.error(f"❌ 外部服务管理器初始化失败: {e}")
             raise
         
-        # 状态文件路径
+        # 状态文件路径，以及最近一次写入内容的摘要（内容未变化时跳过写盘）
         self.state_file = Path(__file__).parent / "service_state.json"
+        self._last_state_hash: Optional[bytes] = None
+        # 根目录的 `service_config.yml`，端口与 Consul 配置都从这里读取
+        self.config_file = Path(__file__).parent / "service_config.yml"
+        # 服务名 -> 端口 索引，以及它所对应的配置对象；配置文件变化（_load_yaml 返回新对象）时重建
+        self._port_index: Dict[str, int] = {}
+        self._port_index_src = None
         
         # 服务状态
         self.running_services = self._load_service_state()
@@ -173,22 +386,25 @@ class ExternalServiceManager:
         sys.exit(0)
     
     def _load_service_state(self) -> Dict:
-        """加载服务状态"""
-        if self.state_file.exists():
-            try:
-                with open(self.state_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except Exception as e:
-                self.logger.warning(f"加载服务状态失败: {e}")
+        """加载服务状态；安装了 orjson 时直接解析原始字节"""
+        try:
+            if orjson is not None:
+                with open(self.state_file, 'rb') as f:
+                    return orjson.loads(f.read())
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            self.logger.warning(f"加载服务状态失败: {e}")
         return {}
 
-    def _enrich_service_entry(self, name: str, pid: Optional[int], svc_type: str):
-        """内部：丰富单个服务的运行时信息并写入 self.running_services"""
-        try:
-            import psutil
-        except Exception:
-            psutil = None
+    def _enrich_service_entry(self, name: str, pid: Optional[int], svc_type: str,
+                              live_pids: Optional[set] = None):
+        """内部：丰富单个服务的运行时信息并写入 self.running_services
 
+        live_pids 为 _live_pids() 的结果，批量调用时由调用方读取一次后传入
+        """
         entry = self.running_services.get(name, {})
         entry.setdefault('pid', pid)
         entry['type'] = svc_type
@@ -205,18 +421,14 @@ class ExternalServiceManager:
             port = None
         entry['port'] = port
 
-        # 状态：检查 pid 是否存活
+        # 状态：检查 pid 是否存活（僵尸进程视为已停止）
         status = 'stopped'
-        if pid and pid > 0 and psutil is not None:
-            try:
-                p = psutil.Process(pid)
-                status = 'running' if p.is_running() and p.status() != psutil.STATUS_ZOMBIE else 'stopped'
-            except Exception:
-                status = 'stopped'
+        if pid and pid > 0 and live_pids is not None:
+            status = 'running' if pid in live_pids and not _is_defunct(pid) else 'stopped'
         elif pid and pid > 0:
             try:
                 os.kill(pid, 0)
-                status = 'running'
+                status = 'stopped' if _is_defunct(pid) else 'running'
             except Exception:
                 status = 'stopped'
 
@@ -224,10 +436,29 @@ class ExternalServiceManager:
         self.running_services[name] = entry
     
     def _save_service_state(self):
-        """保存服务状态"""
+        """
+        保存服务状态
+
+        先写临时文件再 os.replace，避免中途崩溃留下不完整的状态文件；内容与上次写入相同时跳过写盘。
+        安装了 orjson 时用它序列化，输出格式与 json.dump(indent=2, ensure_ascii=False) 相同
+        """
         try:
-            with open(self.state_file, 'w', encoding='utf-8') as f:
-                json.dump(self.running_services, f, indent=2, ensure_ascii=False)
+            if orjson is not None:
+                data = orjson.dumps(self.running_services, option=orjson.OPT_INDENT_2)
+            else:
+                data = json.dumps(self.running_services, indent=2, ensure_ascii=False).encode('utf-8')
+            
+            digest = hashlib.blake2b(data, digest_size=16).digest()
+            if digest == self._last_state_hash and self.state_file.exists():
+                return
+            
+            tmp = self.state_file.with_suffix('.tmp')
+            with open(tmp, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.state_file)
+            self._last_state_hash = digest
         except Exception as e:
             self.logger.error(f"保存服务状态失败: {e}")
     
@@ -265,60 +496,69 @@ class ExternalServiceManager:
             self.logger.info("使用根目录的 `service_config.yml` 作为配置来源")
     
     def _get_service_port_from_config(self, service_name: str) -> Optional[int]:
-        """从配置文件获取服务的真实端口"""
-        try:
-            # 仅从根目录的 `service_config.yml` 加载配置
-            config_file = Path(__file__).parent / "service_config.yml"
-            if not config_file.exists():
-                return None
-
-            config = _load_yaml(config_file, logger=self.logger)
-            if not config:
-                return None
-            
-            # 从ip_port配置中获取端口
-            ip_ports = config.get("external_services", {}).get("ip_port", [])
-            
-            for port_config in ip_ports:
-                if isinstance(port_config, dict):
-                    for svc_name, port_info in port_config.items():
-                        # 处理服务名映射
-                        if (svc_name == service_name or 
-                            (svc_name == "GPTSoVits" and service_name == "GPTSoVits_server") or
-                            (svc_name == "SenseVoice" and service_name == "SenseVoice_server")):
-                            if isinstance(port_info, list) and len(port_info) >= 2:
-                                return int(port_info[1])
-            
-            # 如果在ip_port中没找到，尝试从健康检查URL中提取
-            base_services = config.get("external_services", {}).get("base_services", [])
-            for service_config in base_services:
-                if isinstance(service_config, dict):
-                    svc_name = list(service_config.keys())[0]
-                    if svc_name == service_name:
-                        health_url = service_config[svc_name].get("health_check_url", "")
-                        if health_url:
-                            # 从URL中提取端口，例如 http://127.0.0.1:8500/v1/status/leader
-                            import re
-                            match = re.search(r':(\d+)/', health_url)
-                            if match:
-                                return int(match.group(1))
-            
-        except Exception as e:
-            self.logger.warning(f"从配置获取端口失败 {service_name}: {e}")
+        """从配置文件获取服务的真实端口，配置文件未变化时只查一次索引"""
+        # 仅从根目录的 `service_config.yml` 加载配置
+        config = _load_yaml(self.config_file, logger=self.logger)
+        if not config:
+            return None
         
-        return None
+        if config is not self._port_index_src:
+            self._port_index = self._build_port_index(config)
+            self._port_index_src = config
+        return self._port_index.get(service_name)
+    
+    # ip_port 中的服务名 -> 对应的 base_services 服务名
+    _PORT_ALIASES = {"GPTSoVits": "GPTSoVits_server", "SenseVoice": "SenseVoice_server"}
+    
+    def _build_port_index(self, config: Dict) -> Dict[str, int]:
+        """遍历一次配置，构建 服务名 -> 端口 索引；同一服务出现多次时以第一次为准"""
+        index: Dict[str, int] = {}
+        external = config.get("external_services") or {}
+        
+        # 从ip_port配置中获取端口
+        for port_config in external.get("ip_port") or []:
+            if not isinstance(port_config, dict):
+                continue
+            for svc_name, port_info in port_config.items():
+                if not (isinstance(port_info, list) and len(port_info) >= 2):
+                    continue
+                try:
+                    port = int(port_info[1])
+                except (TypeError, ValueError):
+                    self.logger.warning(f"从配置获取端口失败 {svc_name}: {port_info[1]!r}")
+                    continue
+                index.setdefault(svc_name, port)
+                # 处理服务名映射
+                alias = self._PORT_ALIASES.get(svc_name)
+                if alias:
+                    index.setdefault(alias, port)
+        
+        # ip_port 中没有的服务，尝试从健康检查URL中提取
+        for service_config in external.get("base_services") or []:
+            if not isinstance(service_config, dict) or not service_config:
+                continue
+            svc_name, svc_conf = next(iter(service_config.items()))
+            if svc_name in index or not isinstance(svc_conf, dict):
+                continue
+            health_url = svc_conf.get("health_check_url", "")
+            if health_url:
+                match = _PORT_RE.search(health_url)
+                if match:
+                    index[svc_name] = int(match.group(1))
+        
+        return index
     
     def _init_consul_integration(self):
         """初始化Consul集成"""
-        if not HAS_CONSUL_INTEGRATION:
-            self.logger.warning("Consul集成模块不可用，跳过Consul功能")
-            return
-        
         try:
             # 加载Consul配置
             consul_config = self._load_consul_config()
             
             if consul_config.get("enabled", False):
+                ConsulIntegrationManager = _import_consul_integration(self.logger)
+                if ConsulIntegrationManager is None:
+                    self.logger.warning("Consul集成模块不可用，跳过Consul功能")
+                    return
                 self.consul_manager = ConsulIntegrationManager(
                     consul_config=consul_config,
                     logger=self.logger
@@ -332,18 +572,14 @@ class ExternalServiceManager:
     def _load_consul_config(self) -> Dict:
         """加载Consul配置"""
         # 仅从根目录的 `service_config.yml` 加载 Consul 设置
-        project_root = Path(__file__).parent
-        config_file = project_root / "service_config.yml"
-
-        if not config_file.exists():
-            return {"enabled": False}
-
         try:
-            import yaml
-            with open(config_file, 'r', encoding='utf-8') as f:
-                config = yaml.safe_load(f) or {}
+            # 文件不存在或解析失败时 _load_yaml 返回 None
+            config = _load_yaml(self.config_file, logger=self.logger)
+            if config is None:
+                return {"enabled": False}
 
-            consul_config = config.get("consul", {})
+            # 复制一份再修改，避免污染 yaml 缓存
+            consul_config = dict(config.get("consul", {}))
             consul_config.setdefault("enabled", True)
             return consul_config
         except Exception as e:
@@ -359,15 +595,12 @@ class ExternalServiceManager:
             base_results, optional_results = self.manager.init_services(state_dict=self.running_services)
 
             # 丰富运行时信息：类型、端口、状态
-            try:
-                import psutil
-            except Exception:
-                psutil = None
-
+            # 一次读取 /proc 得到存活 pid 集合，而不是每个服务各查询一次
+            live_pids = _live_pids()
             for name, pid in (base_results or []):
-                self._enrich_service_entry(name, pid, 'base')
+                self._enrich_service_entry(name, pid, 'base', live_pids)
             for name, pid in (optional_results or []):
-                self._enrich_service_entry(name, pid, 'optional')
+                self._enrich_service_entry(name, pid, 'optional', live_pids)
 
             self._save_service_state()
             self.logger.info(f"✅ 服务启动完成！共启动 {len(self.running_services)} 个服务")
@@ -397,8 +630,8 @@ class ExternalServiceManager:
         
         # 获取详细状态
         try:
-            if hasattr(self, 'manager') and hasattr(self.manager, 'get_service_status'):
-                legacy_status = self.manager.get_service_status()
+            if self._status_fn is not None:
+                legacy_status = self._status_fn()
                 status["legacy_status"] = legacy_status
         except Exception as e:
             self.logger.warning(f"获取管理器状态失败: {e}")
@@ -429,10 +662,28 @@ class ExternalServiceManager:
         """停止单个服务"""
         self.logger.info(f"🛑 停止服务: {service_name}")
         
-        # TODO: 实现单个服务停止
-        # 当前传统管理器不支持单个服务停止，这将在后续版本实现
-        self.logger.warning("单个服务停止功能待实现，请使用 stop 命令停止所有服务")
-        return False
+        info = self.running_services.get(service_name)
+        pid = info.get('pid') if info else None
+        try:
+            if self._stop_one_fn is not None and self._stop_one_fn(service_name):
+                # 本进程启动的服务：管理器已向其进程组发送 SIGTERM，这里等待退出，超时后 SIGKILL
+                if pid:
+                    _terminate_processes([], groups=(pid,))
+            elif info is None:
+                self.logger.warning(f"未找到服务 {service_name} 的运行记录")
+                return False
+            elif not pid or not _terminate_process_tree(pid, logger=self.logger):
+                self.logger.warning(f"服务 {service_name} 的进程不存在 (pid={pid})")
+        except Exception as e:
+            self.logger.error(f"❌ 停止服务 {service_name} 失败: {e}")
+            return False
+        
+        if info is not None:
+            self._deregister_services_from_consul({service_name: info})
+            self.running_services.pop(service_name, None)
+            self._save_service_state()
+        self.logger.info(f"✅ 服务已停止: {service_name}")
+        return True
     
     def consul_register_all(self) -> bool:
         """向Consul注册所有服务"""
@@ -443,12 +694,13 @@ class ExternalServiceManager:
                 self.logger.warning("Consul集成未初始化，无法注册服务")
                 return False
             
-            for service_name, service_info in self.running_services.items():
-                try:
-                    self.consul_manager.on_service_started(service_name, service_info)
+            # 所有服务的端口等待和注册并发进行，而不是逐个等待
+            results = self.consul_manager.on_services_started(self.running_services)
+            for service_name, ok in results.items():
+                if ok:
                     self.logger.info(f"✅ 服务已注册到Consul: {service_name}")
-                except Exception as e:
-                    self.logger.warning(f"向Consul注册服务失败 {service_name}: {e}")
+                else:
+                    self.logger.warning(f"向Consul注册服务失败 {service_name}")
             
             return True
         except Exception as e:
@@ -464,12 +716,13 @@ class ExternalServiceManager:
                 self.logger.warning("Consul集成未初始化，无法注销服务")
                 return False
             
-            for service_name, service_info in self.running_services.items():
-                try:
-                    self.consul_manager.on_service_stopped(service_name, service_info)
+            # 各服务的注销请求并发执行
+            results = self.consul_manager.on_services_stopped(self.running_services)
+            for service_name, ok in results.items():
+                if ok:
                     self.logger.info(f"✅ 服务已从Consul注销: {service_name}")
-                except Exception as e:
-                    self.logger.warning(f"从Consul注销服务失败 {service_name}: {e}")
+                else:
+                    self.logger.warning(f"从Consul注销服务失败 {service_name}")
             
             return True
         except Exception as e:
@@ -509,22 +762,20 @@ class ExternalServiceManager:
         if not self.consul_manager:
             return
         
-        for service_name, service_info in services.items():
-            try:
-                self.consul_manager.on_service_started(service_name, service_info)
-            except Exception as e:
-                self.logger.warning(f"向Consul注册服务失败 {service_name}: {e}")
+        try:
+            self.consul_manager.on_services_started(services)
+        except Exception as e:
+            self.logger.warning(f"向Consul注册服务失败: {e}")
     
     def _deregister_services_from_consul(self, services: Dict[str, Dict]):
         """从Consul注销服务"""
         if not self.consul_manager:
             return
         
-        for service_name, service_info in services.items():
-            try:
-                self.consul_manager.on_service_stopped(service_name, service_info)
-            except Exception as e:
-                self.logger.warning(f"从Consul注销服务失败 {service_name}: {e}")
+        try:
+            self.consul_manager.on_services_stopped(services)
+        except Exception as e:
+            self.logger.warning(f"从Consul注销服务失败: {e}")
     
     def _get_consul_status(self) -> Dict:
         """获取Consul状态信息"""
@@ -581,82 +832,96 @@ class ExternalServiceManager:
                 self._deregister_services_from_consul(self.running_services)
 
             # Prefer using psutil for reliable process inspection and termination.
-            try:
-                import psutil
-            except Exception:
-                psutil = None
-
             killed = 0
 
             if psutil is None:
-                self.logger.warning("psutil 未安装，无法按命令或端口精确匹配进程；将调用管理器的 stop_all_services() 作为退路")
-            # 遍历已记录的服务，尝试多种方式终止
-            for svc_name, info in list(self.running_services.items()):
+                self.logger.warning("psutil 未安装，无法按端口匹配进程；将扫描 /proc 按命令行匹配，并调用管理器的 stop_all_services() 作为退路")
+
+            # 方式1：按照记录的 pid 终止。ProcessRunner 启动的服务是独立进程组的组长，直接 killpg 整个组；
+            # 其余的先收集进程树，与方式2匹配到的进程合并后统一发送 SIGTERM、只等待一次（最多 3 秒），
+            # 而不是每个服务各等 3 秒
+            services = list(self.running_services.items())
+            stopped_by_pid = {}
+            victims = {}  # pid -> psutil.Process，多个服务匹配到同一进程时只终止一次
+            groups = []  # 已发送 SIGTERM 的进程组（组长 pid）
+            for svc_name, info in services:
                 pid = info.get('pid')
-                stopped = False
+                if not pid:
+                    continue
+                if _signal_process_group(pid):
+                    groups.append(pid)
+                    stopped_by_pid[svc_name] = True
+                    self.logger.info(f"已基于 pid 终止服务 {svc_name} (进程组 {pid})")
+                    continue
+                if psutil is None:
+                    continue
+                try:
+                    tree = _collect_process_tree(pid)
+                except Exception as e:
+                    self.logger.warning(f"按 pid 终止服务失败 {svc_name} (pid={pid}): {e}")
+                    continue
+                if tree:
+                    for proc in tree:
+                        victims.setdefault(proc.pid, proc)
+                    stopped_by_pid[svc_name] = True
+                    self.logger.info(f"已基于 pid 终止服务 {svc_name} (pid={pid})")
+                else:
+                    self.logger.info(f"记录的 pid 不存在: {svc_name} (pid={pid})，将尝试按命令/端口匹配")
+            killed += len(stopped_by_pid)
 
-                # 方式1：按照记录的 pid 终止
-                if pid and psutil is not None:
+            # pid 方式未能终止的服务再尝试其他方式
+            remaining = [(svc_name, info) for svc_name, info in services if not stopped_by_pid.get(svc_name, False)]
+
+            # 方式2：按命令行或服务名或端口匹配进程。进程表和监听端口表各只扫描一次，
+            # 再对所有剩余服务逐一匹配，而不是每个服务都遍历一遍所有进程及其连接
+            if remaining and psutil is not None:
+                ports = {}
+                for svc_name, info in remaining:
+                    # port 可能是 'unknown' 或字符串
+                    pval = info.get('port')
+                    if isinstance(pval, int):
+                        ports[svc_name] = pval
+                    elif isinstance(pval, str) and pval.isdigit():
+                        ports[svc_name] = int(pval)
+
+                snapshot = []
+                for proc in psutil.process_iter(['pid', 'name', 'cmdline']):
                     try:
-                        if _terminate_process_tree(pid, logger=self.logger):
-                            stopped = True
-                            killed += 1
-                            self.logger.info(f"已基于 pid 终止服务 {svc_name} (pid={pid})")
-                    except psutil.NoSuchProcess:
-                        self.logger.info(f"记录的 pid 不存在: {svc_name} (pid={pid})，将尝试按命令/端口匹配")
+                        cmdline = ' '.join(proc.info.get('cmdline') or [])
+                        snapshot.append((proc, cmdline, proc.info.get('name') or ''))
+                    except Exception:
+                        continue
+
+                # 端口 -> 监听该端口的 pid 集合
+                pids_by_port = {}
+                if ports:
+                    try:
+                        for c in psutil.net_connections(kind='inet'):
+                            if c.pid and c.laddr:
+                                pids_by_port.setdefault(c.laddr.port, set()).add(c.pid)
                     except Exception as e:
-                        self.logger.warning(f"按 pid 终止服务失败 {svc_name} (pid={pid}): {e}")
+                        self.logger.warning(f"获取端口监听信息失败，仅按命令行匹配: {e}")
 
-                # 方式2：按命令行或服务名或端口匹配进程
-                if not stopped and psutil is not None:
+                for svc_name, info in remaining:
+                    pid = info.get('pid')
                     try:
                         script = info.get('script') or ''
-                        port = None
-                        try:
-                            # port 可能是 'unknown' 或字符串
-                            pval = info.get('port')
-                            if isinstance(pval, int):
-                                port = pval
-                            elif isinstance(pval, str) and pval.isdigit():
-                                port = int(pval)
-                        except Exception:
-                            port = None
-
-                        candidates = []
-                        for proc in psutil.process_iter(['pid', 'name', 'cmdline']):
-                            try:
-                                cmdline_list = proc.info.get('cmdline') or []
-                                cmdline = ' '.join(cmdline_list)
-                                pname = proc.info.get('name') or ''
-
-                                matched = False
-                                if script and script in cmdline:
-                                    matched = True
-                                if not matched and svc_name and (svc_name in pname or svc_name in cmdline):
-                                    matched = True
-
-                                # 检查端口监听
-                                if not matched and port:
-                                    try:
-                                        for c in proc.connections(kind='inet'):
-                                            laddr = c.laddr
-                                            if laddr and getattr(laddr, 'port', None) == port:
-                                                matched = True
-                                                break
-                                    except Exception:
-                                        pass
-
-                                if matched:
-                                    candidates.append(proc)
-                            except Exception:
-                                continue
+                        port_pids = pids_by_port.get(ports.get(svc_name), ())
+                        candidates = [
+                            proc for proc, cmdline, pname in snapshot
+                            if (script and script in cmdline)
+                            or (svc_name and (svc_name in pname or svc_name in cmdline))
+                            or proc.pid in port_pids
+                        ]
 
                         if candidates:
                             for proc in candidates:
                                 try:
-                                    if _terminate_process_tree(proc.pid, logger=self.logger):
+                                    tree = _collect_process_tree(proc.pid)
+                                    if tree:
+                                        for child in tree:
+                                            victims.setdefault(child.pid, child)
                                         killed += 1
-                                        stopped = True
                                         self.logger.info(f"通过命令/端口匹配终止服务 {svc_name} (pid={proc.pid})")
                                     else:
                                         self.logger.warning(f"尝试终止匹配进程失败 {svc_name} (pid={proc.pid})")
@@ -666,13 +931,28 @@ class ExternalServiceManager:
                             self.logger.warning(f"无法找到匹配的进程以终止 {svc_name} (pid={pid})")
                     except Exception as e:
                         self.logger.warning(f"尝试按命令或端口匹配终止 {svc_name} 失败: {e}")
+            elif remaining:
+                # psutil 不可用：扫描 /proc 按命令行匹配
+                for svc_name, info in remaining:
+                    script = info.get('script') or ''
+                    args = info.get('args') or ()
+                    for match_pid in _find_pids_by_cmdline(script, args, exclude=(os.getpid(),)):
+                        if _terminate_process_tree(match_pid, logger=self.logger):
+                            killed += 1
+                            self.logger.info(f"通过命令行匹配终止服务 {svc_name} (pid={match_pid})")
+
+            # 方式1、2 收集到的所有进程一起终止
+            try:
+                _terminate_processes(list(victims.values()), groups=groups)
+            except Exception as e:
+                self.logger.warning(f"批量终止进程失败: {e}")
 
-                # 记录停止失败也继续循环，最后统一调用 manager 的 stop_all_services 作为额外保障
+            # 记录停止失败也继续，最后统一调用 manager 的 stop_all_services 作为额外保障
 
             # 使用新管理器停止本进程内的服务（如果它在本次运行中启动过）
-            if hasattr(self, 'manager') and hasattr(self.manager, 'stop_all_services'):
+            if self._stop_all_fn is not None:
                 try:
-                    self.manager.stop_all_services()
+                    self._stop_all_fn()
                 except Exception as e:
                     self.logger.warning(f"调用内部管理器停止服务失败: {e}")
             else:
@@ -784,7 +1064,7 @@ def main():
   python service_manager.py consul-unregister        # 从Consul注销服务
   python service_manager.py consul-discover          # 从Consul发现服务
   python service_manager.py start ollama_server      # 启动指定服务 (待实现)
-  python service_manager.py stop ollama_server       # 停止指定服务 (待实现)
+  python service_manager.py stop ollama_server       # 停止指定服务
         """
     )
     